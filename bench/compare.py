@@ -0,0 +1,60 @@
+"""
+Compare two bench.run result files metric by metric.
+
+  python -m bench.compare OLD.json NEW.json                 # every numeric metric
+  python -m bench.compare OLD.json NEW.json --threshold 10  # only changes of 10% or more; exit 1 on a regression
+"""
+import argparse
+import json
+import sys
+
+# metrics where a larger number is better; everything else (latency, bytes, seconds) is better smaller
+_HIGHER_IS_BETTER = ("_per_s", "hit_rate", "hits")
+_SKIP = ("environment", "params", "workdir", "growth")
+
+
+def flatten(data, prefix: str = "") -> dict[str, float]:
+    out: dict[str, float] = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in _SKIP:
+                continue
+            out.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        out[prefix.rstrip(".")] = float(data)
+    return out
+
+
+def compare(old: dict, new: dict, threshold: float = 0.0) -> list[dict]:
+    a, b = flatten(old), flatten(new)
+    rows = []
+    for name in sorted(a.keys() & b.keys()):
+        before, after = a[name], b[name]
+        change = (after - before) / before * 100 if before else (0.0 if after == before else float("inf"))
+        if abs(change) < threshold:
+            continue
+        better = after >= before if name.endswith(_HIGHER_IS_BETTER) else after <= before
+        rows.append({"metric": name, "old": before, "new": after, "change_pct": change, "regression": not better})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.0, help="hide changes smaller than this many percent")
+    args = parser.parse_args()
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"old: {old.get('environment', {}).get('commit')}  new: {new.get('environment', {}).get('commit')}")
+    rows = compare(old, new, args.threshold)
+    for r in rows:
+        flag = "worse" if r["regression"] and r["change_pct"] else "     "
+        print(f"{flag} {r['metric']:<45} {r['old']:>14.3f} -> {r['new']:>14.3f}  {r['change_pct']:+7.1f}%")
+    sys.exit(1 if args.threshold and any(r["regression"] for r in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
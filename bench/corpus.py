@@ -0,0 +1,64 @@
+"""Synthetic corpora and conversations of configurable size (deterministic for a given seed)."""
+import os
+import numpy as np
+
+_CJK = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严"
+_LATIN = [f"term{i}" for i in range(2000)]
+
+
+def _sentence(rng, words: int) -> str:
+    parts = []
+    for _ in range(words):
+        if rng.random() < 0.6:
+            n = int(rng.integers(2, 5))
+            parts.append("".join(_CJK[int(i)] for i in rng.zipf(1.3, n) % len(_CJK)))
+        else:
+            parts.append(_LATIN[int(rng.zipf(1.2)) % len(_LATIN)])
+    return " ".join(parts) + "。"
+
+
+def make_corpus(path: str, files: int = 100, words_per_file: int = 800, dup_ratio: float = 0.1, seed: int = 0) -> list[str]:
+    """
+    Write `files` text files of roughly words_per_file mixed Chinese/Latin words under path.
+    A dup_ratio share of files repeat an earlier file with a small edit (near duplicates).
+    Returns the file paths.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+    written: list[str] = []
+    texts: list[str] = []
+    for i in range(files):
+        if texts and rng.random() < dup_ratio:
+            base = texts[int(rng.integers(0, len(texts)))]
+            text = base.replace("。", "，", 1)
+        else:
+            paragraphs = []
+            left = words_per_file
+            while left > 0:
+                n = min(left, int(rng.integers(40, 120)))
+                paragraphs.append("".join(_sentence(rng, int(rng.integers(6, 16))) for _ in range(max(1, n // 10))))
+                left -= n
+            text = "\n\n".join(paragraphs)
+        texts.append(text)
+        file = os.path.join(path, f"doc_{i:05d}.txt")
+        with open(file, "w", encoding="utf-8") as f:
+            f.write(text)
+        written.append(file)
+    return written
+
+
+def make_queries(count: int = 100, seed: int = 1, repeat_ratio: float = 0.2) -> list[str]:
+    """Short queries over the corpus vocabulary; a repeat_ratio share re-asks an earlier query (cache hits)."""
+    rng = np.random.default_rng(seed)
+    queries: list[str] = []
+    for _ in range(count):
+        if queries and rng.random() < repeat_ratio:
+            queries.append(queries[int(rng.integers(0, len(queries)))])
+        else:
+            queries.append(_sentence(rng, int(rng.integers(2, 6))).rstrip("。"))
+    return queries
+
+
+def make_conversation(turns: int = 20, seed: int = 2) -> list[str]:
+    """User turns for one synthetic conversation."""
+    return make_queries(turns, seed=seed, repeat_ratio=0.0)
@@ -0,0 +1,92 @@
+"""Deterministic stand-ins for the DashScope chat model and the embedding model, for offline benchmarks."""
+import hashlib
+import time
+from typing import Any, Iterator
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from llama_index.core.embeddings import BaseEmbedding
+from src.bm25 import tokenize
+
+
+def _hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class HashEmbedding(BaseEmbedding):
+    """
+    Bag-of-tokens feature hashing over the BM25 tokenizer: texts sharing words get similar
+    vectors, so retrieval quality is meaningful without a model. Optional per-call latency
+    simulates a remote embedding API.
+    """
+    dim: int = 256
+    latency: float = 0.0
+    model_name: str = "hash-embedding"
+
+    def _vector(self, text: str) -> list[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            h = _hash(token)
+            vec[h % self.dim] += 1.0 if (h >> 63) else -1.0
+        norm = float(np.linalg.norm(vec))
+        return (vec / norm if norm else vec).tolist()
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._vector(text)
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        # one simulated round-trip per batch, like a batched API call
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._get_text_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return self._get_query_embedding(query)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model whose answer is a deterministic function of the prompt. Supports streaming
+    (one chunk per word) and bind_tools (tools are ignored). latency is slept once per call,
+    token_latency once per streamed word.
+    """
+    reply_words: int = 24
+    latency: float = 0.0
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-bench"
+
+    def _words(self, messages: list[BaseMessage]) -> list[str]:
+        seed = _hash("\x00".join(str(m.content) for m in messages))
+        rng = np.random.default_rng(seed)
+        return [f"w{int(x)}" for x in rng.integers(0, 5000, self.reply_words)]
+
+    def _generate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        words = self._words(messages)
+        if self.token_latency:
+            time.sleep(self.token_latency * len(words))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(words)))])
+
+    def _stream(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        if self.latency:
+            time.sleep(self.latency)
+        for i, word in enumerate(self._words(messages)):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def bind_tools(self, tools, **kwargs):
+        return self
@@ -0,0 +1,94 @@
+"""
+Import-time and startup budget check.
+
+Each measurement runs in a fresh interpreter (best of --repeat runs) from the repository root:
+  python bench/import_budget.py            # table, exit code 1 if anything is over budget
+  python bench/import_budget.py --json     # machine-readable results
+  python bench/import_budget.py --importtime contextmgr.loader   # -X importtime breakdown, slowest first
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# milliseconds; roughly 2x what a warm run measures, so only real regressions trip them
+BUDGETS_MS = {
+    "contextmgr": 20,
+    "contextmgr.multiuser": 20,
+    "contextmgr.loader": 150,
+    "src.retrieval": 100,
+    "src.runtime": 20,
+    "cli": 800,
+}
+# import cli + load_context_app(configs/context.yaml) + seed: time until the REPL can prompt
+STARTUP_BUDGET_MS = 1500
+
+_IMPORT = "import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+_STARTUP = (
+    "import time; t = time.perf_counter()\n"
+    "import cli\n"
+    "from contextmgr import load_context_app\n"
+    "app, seed, ds = load_context_app({config!r}, tools=[cli.strlen])\n"
+    "seed('budget')\n"
+    "print((time.perf_counter() - t) * 1000)\n"
+)
+
+
+def _run(code: str) -> float:
+    env = {**os.environ, "PYTHONWARNINGS": "ignore"}
+    # the LLM client is created lazily, but make sure startup never needs a real key
+    env.setdefault("DASHSCOPE_API_KEY", "budget-check")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else f"exit {out.returncode}")
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def measure(repeat: int = 3, config: str = "configs/context.yaml") -> list[dict]:
+    results = []
+    for module, budget in BUDGETS_MS.items():
+        ms = min(_run(_IMPORT.format(module=module)) for _ in range(repeat))
+        results.append({"name": f"import {module}", "ms": round(ms, 1), "budget_ms": budget, "ok": ms <= budget})
+    ms = min(_run(_STARTUP.format(config=config)) for _ in range(repeat))
+    results.append({"name": "startup", "ms": round(ms, 1), "budget_ms": STARTUP_BUDGET_MS, "ok": ms <= STARTUP_BUDGET_MS})
+    return results
+
+
+def importtime(module: str, top: int = 20):
+    """Print the slowest imports (cumulative microseconds) pulled in by `import module`."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                         capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        rows.append((int(cumulative), name.rstrip()))
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:8.1f} ms {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--config", default="configs/context.yaml")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--importtime", metavar="MODULE")
+    args = parser.parse_args()
+    if args.importtime:
+        importtime(args.importtime)
+        return
+    results = measure(args.repeat, args.config)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print(f"{'ok  ' if r['ok'] else 'OVER'} {r['name']:<30} {r['ms']:8.1f} ms  (budget {r['budget_ms']} ms)")
+    sys.exit(0 if all(r["ok"] for r in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
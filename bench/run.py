@@ -0,0 +1,289 @@
+"""
+Offline benchmark: a synthetic corpus, a hash embedder and a fake chat model (bench/fakes.py),
+so runs need no network or API key and are comparable across commits.
+
+Stages (all by default, or pick with --stages):
+  ingest      files/s, chunks/s and MB/s through load_context_app's index build
+  retrieve    DocStore.retrieve latency percentiles, cold (first ask) and warm (query cache)
+  turns       per-turn graph latency through send_user_message, plus streamed time-to-first-token
+  checkpoint  SQLiteDeltaSaver file growth per turn, before and after compaction
+Peak RSS is recorded for the whole run; --tracemalloc adds Python-level peak allocations per stage.
+
+  python -m bench.run                                  # writes bench/results/<timestamp>.json
+  python -m bench.run --files 2000 --turns 200 --out big.json
+  python -m bench.compare bench/results/a.json bench/results/b.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def percentiles(samples_ms: list[float]) -> dict:
+    if not samples_ms:
+        return {"n": 0}
+    arr = np.asarray(samples_ms)
+    return {
+        "n": len(samples_ms),
+        "mean_ms": round(float(arr.mean()), 3),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+        "max_ms": round(float(arr.max()), 3),
+    }
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+@contextmanager
+def _traced(result: dict, enabled: bool):
+    if not enabled:
+        yield
+        return
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["tracemalloc_peak_mb"] = round(peak / (1024 * 1024), 1)
+
+
+def _environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+def _write_config(workdir: str, corpus_dir: str, args) -> str:
+    cfg = {
+        "system": "你是基准测试助理",
+        "context": {"policies": ["回答要简洁"], "facts": ["基准测试不访问网络"]},
+        "doc_dirs": [corpus_dir],
+        "embed_cache": None,
+        "ingest": {"workers": args.workers, "chunk_size": args.chunk_size, "chunk_overlap": args.chunk_size // 8},
+        "retrieval": {"mode": args.mode},
+        "checkpoint": {"path": os.path.join(workdir, "checkpoints.sqlite"), "keep_last": args.keep_last},
+        "history": {"max_messages": 20, "max_tokens": 2000, "summarize": True},
+        "context_budget": {"max_tokens": 1500, "truncate": True},
+    }
+    path = os.path.join(workdir, "bench.yaml")
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(cfg, f, allow_unicode=True)
+    return path
+
+
+def bench_ingest(config: str, corpus_bytes: int, fakes: dict, trace: bool) -> tuple[dict, tuple]:
+    from contextmgr import load_context_app
+    result: dict = {}
+    with _traced(result, trace):
+        started = time.perf_counter()
+        app, seed, ds = load_context_app(config, **fakes)
+        seconds = time.perf_counter() - started
+    report = ds.last_report
+    # throughput uses the pipeline's own clock; load_seconds adds imports and graph construction
+    result.update({
+        "load_seconds": round(seconds, 3),
+        "seconds": round(report.seconds, 3),
+        "files": report.files,
+        "chunks": report.chunks,
+        "duplicates": report.duplicates,
+        "errors": len(report.errors),
+        "files_per_s": round(report.files / report.seconds, 1) if report.seconds else None,
+        "chunks_per_s": round(report.chunks / report.seconds, 1) if report.seconds else None,
+        "mb_per_s": round(corpus_bytes / (1024 * 1024) / report.seconds, 2) if report.seconds else None,
+    })
+    return result, (app, seed, ds)
+
+
+def bench_retrieve(ds, queries: list[str], top_k: int, trace: bool) -> dict:
+    result: dict = {}
+    with _traced(result, trace):
+        cold, warm = [], []
+        for q in dict.fromkeys(queries):
+            t = time.perf_counter()
+            ds.retrieve(q, top_k=top_k)
+            cold.append((time.perf_counter() - t) * 1000)
+        for q in queries:
+            t = time.perf_counter()
+            ds.retrieve(q, top_k=top_k)
+            warm.append((time.perf_counter() - t) * 1000)
+    result.update({"top_k": top_k, "cold": percentiles(cold), "warm": percentiles(warm), "cache": ds.cache_stats()})
+    return result
+
+
+def bench_turns(app, seed, conversation: list[str], threads: int, trace: bool) -> tuple[dict, list[dict]]:
+    from src.runtime import astream_user_message, send_user_message
+    result: dict = {}
+    with _traced(result, trace):
+        per_turn, growth = [], []
+        checkpointer = app.checkpointer
+        db_path = getattr(checkpointer, "path", None)
+        for t in range(threads):
+            tid = f"bench:{t}"
+            seed(tid)
+            for i, text in enumerate(conversation):
+                started = time.perf_counter()
+                send_user_message(app, tid, text)
+                per_turn.append((time.perf_counter() - started) * 1000)
+                if t == 0 and db_path:
+                    checkpointer.flush()
+                    growth.append({"turn": i + 1, "bytes": _db_bytes(db_path)})
+
+        async def first_tokens():
+            samples = []
+            tid = "bench:stream"
+            seed(tid)
+            for text in conversation:
+                started = time.perf_counter()
+                first = None
+                async for _ in astream_user_message(app, tid, text):
+                    if first is None:
+                        first = (time.perf_counter() - started) * 1000
+                samples.append(first if first is not None else (time.perf_counter() - started) * 1000)
+            return samples
+
+        ttft = asyncio.run(first_tokens())
+    result.update({
+        "threads": threads,
+        "turns_per_thread": len(conversation),
+        "turn": percentiles(per_turn),
+        "stream_first_token": percentiles(ttft),
+        "prefix_cache": app.prefix_cache.stats(),
+    })
+    return result, growth
+
+
+def _db_bytes(path: str) -> int:
+    """Bytes in use by the database, read through the WAL and not counting free pages."""
+    conn = sqlite3.connect(path)
+    try:
+        page_size, pages, free = (conn.execute(f"PRAGMA {p}").fetchone()[0]
+                                  for p in ("page_size", "page_count", "freelist_count"))
+    finally:
+        conn.close()
+    return page_size * (pages - free)
+
+
+def bench_checkpoint(app, growth: list[dict], keep_last: int) -> dict:
+    checkpointer = app.checkpointer
+    db_path = getattr(checkpointer, "path", None)
+    if not db_path:
+        return {"skipped": "in-memory checkpointer"}
+    checkpointer.flush()
+    before = _db_bytes(db_path)
+    started = time.perf_counter()
+    compacted = checkpointer.compact(keep_last, vacuum=True)
+    seconds = time.perf_counter() - started
+    per_turn = None
+    if len(growth) > 1:
+        per_turn = round((growth[-1]["bytes"] - growth[0]["bytes"]) / (growth[-1]["turn"] - growth[0]["turn"]))
+    return {
+        "growth": growth,
+        "bytes_per_turn": per_turn,
+        "bytes_before_compact": before,
+        "bytes_after_compact": _db_bytes(db_path),
+        "compact_seconds": round(seconds, 3),
+        "compact": compacted,
+    }
+
+
+def run(args) -> dict:
+    from bench.corpus import make_conversation, make_corpus, make_queries
+    from bench.fakes import FakeChatModel, HashEmbedding
+
+    stages = set(args.stages.split(","))
+    workdir = tempfile.mkdtemp(prefix="ctxbench-")
+    corpus_dir = os.path.join(workdir, "corpus")
+    started = time.perf_counter()
+    paths = make_corpus(corpus_dir, args.files, args.words, args.dup_ratio, args.seed)
+    corpus_bytes = sum(os.path.getsize(p) for p in paths)
+    config = _write_config(workdir, corpus_dir, args)
+    fakes = {
+        "llm": FakeChatModel(latency=args.llm_latency, token_latency=args.token_latency),
+        "embed_model": HashEmbedding(latency=args.embed_latency),
+    }
+    results: dict = {
+        "environment": _environment(),
+        "params": {k: v for k, v in vars(args).items() if k != "out"},
+        "corpus": {"files": len(paths), "bytes": corpus_bytes, "generate_seconds": round(time.perf_counter() - started, 3)},
+    }
+    ingest, (app, seed, ds) = bench_ingest(config, corpus_bytes, fakes, args.tracemalloc)
+    if "ingest" in stages:
+        results["ingest"] = ingest
+    if "retrieve" in stages:
+        results["retrieve"] = bench_retrieve(ds, make_queries(args.queries, seed=args.seed + 1), args.top_k, args.tracemalloc)
+    if stages & {"turns", "checkpoint"}:
+        turns, growth = bench_turns(app, seed, make_conversation(args.turns, seed=args.seed + 2), args.threads,
+                                    args.tracemalloc)
+        if "turns" in stages:
+            results["turns"] = turns
+        if "checkpoint" in stages:
+            results["checkpoint"] = bench_checkpoint(app, growth, args.keep_last)
+    results["peak_rss_mb"] = _peak_rss_mb()
+    results["workdir"] = workdir
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", default="ingest,retrieve,turns,checkpoint")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--words", type=int, default=800, help="words per corpus file")
+    parser.add_argument("--dup-ratio", type=float, default=0.1)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--mode", default="hybrid", choices=["vector", "bm25", "hybrid"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--turns", type=int, default=30, help="turns per conversation")
+    parser.add_argument("--threads", type=int, default=2, help="conversations")
+    parser.add_argument("--keep-last", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake LLM call")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds per streamed word")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per fake embedding request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tracemalloc", action="store_true", help="record Python peak allocations per stage (slower)")
+    parser.add_argument("--out", help="result file (default bench/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    results = run(args)
+    out = args.out or os.path.join(ROOT, "bench", "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(json.dumps({k: v for k, v in results.items() if k not in ("environment", "params")}, indent=2,
+                     ensure_ascii=False))
+    print(f"saved {out}")
+
+
+if __name__ == "__main__":
+    main()
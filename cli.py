@@ -1,7 +1,8 @@
+import asyncio
 import os
 import sys
 from contextmgr import load_context_app, SessionManager
-from src.runtime import send_user_message, get_state
+from src.runtime import astream_user_message, get_state
 from src.tools import strlen
 GLOBAL_DS = None
 
@@ -23,6 +24,21 @@ def print_context(values: dict):
             print(f"\n[{bucket.capitalize()}]:")
             for item in items:
                 print(f"  - {str(item)}")
+    fact_ids = values.get('context_fact_ids') or []
+    if fact_ids:
+        print("\n[Retrieved Chunks]:")
+        for cid in fact_ids:
+            doc = GLOBAL_DS.get_chunk(cid) if GLOBAL_DS is not None else None
+            source = doc.metadata.get('source', 'unknown') if doc is not None else '(not in index)'
+            print(f"  - {cid}: {source}")
+    trimmed = values.get('context_trimmed') or {}
+    if trimmed:
+        print(f"\n[Budget]: {trimmed.get('used')}/{trimmed.get('max_tokens')} tokens, "
+              f"dropped={trimmed.get('dropped') or {}}, truncated={trimmed.get('truncated') or {}}")
+    prefix = values.get('prompt_prefix') or {}
+    if prefix:
+        cached = f", provider cached={prefix['cached_tokens']}" if 'cached_tokens' in prefix else ""
+        print(f"[Prompt Prefix]: {prefix.get('hash')} ~{prefix.get('tokens')} tokens, reused={prefix.get('reused')}{cached}")
     merged = values.get('context') or []
     if merged:
         print("\n[Merged Context]:")
@@ -44,6 +60,58 @@ def print_context(values: dict):
     
     print("="*57 + "\n")
 
+LOADING = True
+
+def print_progress(stage: str, done: int, total: int):
+    # a background index build must not draw over the REPL prompt
+    if not LOADING:
+        return
+    end = "\n" if done >= total else ""
+    print(f"\r[{stage}] {done}/{total}", end=end, flush=True)
+
+def print_report(ds) -> bool:
+    """Print the ingestion report once the index is ready; returns False while it is still building."""
+    if not ds.ready:
+        return False
+    if ds.build_error is not None:
+        print(f"Knowledge base: build failed: {ds.build_error}")
+    report = ds.last_report
+    if report is not None:
+        print(f"Knowledge base: {report.summary()}")
+        for path, error in report.errors.items():
+            print(f"  ! {path}: {error}")
+    return True
+
+def print_stats(app, sm, args: list[str]):
+    metrics = getattr(app, "metrics", None)
+    if metrics is None:
+        print("Metrics are disabled (metrics.enabled: false).")
+        return
+    if args[:1] == ["reset"]:
+        metrics.reset()
+        print("Metrics reset.")
+        return
+    if args[:1] == ["profile"]:
+        metrics.profile_next()
+        print("The next turn will be profiled; see /stats afterwards.")
+        return
+    print("\n" + "="*20 + " STATS " + "="*20)
+    print(metrics.report())
+    print(f"sessions: {', '.join(f'{k}={v}' for k, v in sm.stats().items())}")
+    print("="*47 + "\n")
+
+async def stream_reply(app, tid: str, text: str) -> bool:
+    """Print the answer token by token; returns False when nothing was streamed."""
+    streamed = False
+    async for token in astream_user_message(app, tid, text):
+        if not streamed:
+            print("AI> ", end="", flush=True)
+            streamed = True
+        print(token, end="", flush=True)
+    if streamed:
+        print()
+    return streamed
+
 def main():
     print("Initializing Chat CLI...")
     
@@ -51,8 +119,12 @@ def main():
     try:
         # Use a default model if not configured, e.g., 'qwen-plus'
         # Ensure 'DASHSCOPE_API_KEY' is set in environment or .env
-        app, seed, ds = load_context_app("configs/context.yaml", tools=[strlen])
+        app, seed, ds = load_context_app("configs/context.yaml", tools=[strlen], progress=print_progress)
         globals()['GLOBAL_DS'] = ds
+        globals()['LOADING'] = False
+        reported = print_report(ds)
+        if not reported:
+            print("Knowledge base: indexing in background...")
     except Exception as e:
         print(f"Error loading app: {e}")
         print("Make sure 'configs/context.yaml' exists and dependencies are installed.")
@@ -68,12 +140,17 @@ def main():
     print(f"Session started for user: {user_id} (Thread ID: {tid})")
     print("Type 'exit' or 'quit' to end session.")
     print("Type '/context' to view current context state.")
+    print("Type '/reload' to apply changes to the config file and knowledge base.")
+    print("Type '/stats' for timings and cache hit rates ('/stats reset', '/stats profile' to profile the next turn).")
     print("-" * 50)
 
-    # 4. Chat loop
+    # 4. Chat loop; one event loop for the whole session, so turns do not wait on its shutdown
+    runner = asyncio.Runner()
     while True:
         try:
             user_input = input("User> ").strip()
+            if not reported:
+                reported = print_report(ds)
             if not user_input:
                 continue
             
@@ -89,10 +166,29 @@ def main():
                     print("Context is empty or state unavailable.")
                 continue
                 
-            # Send message
-            send_user_message(app, tid, user_input)
+            if user_input.lower() == "/reload":
+                if not ds.ready:
+                    print("Knowledge base is still indexing; try again when it is ready.")
+                    continue
+                result = app.reload()
+                print(f"Knowledge base: {result['report'].summary()}")
+                for path, error in result['report'].errors.items():
+                    print(f"  ! {path}: {error}")
+                if result["seed_changed"]:
+                    # the current conversation picks up the new system prompt and buckets too
+                    seed(tid)
+                    print("Context settings reloaded for this session.")
+                continue
+
+            if user_input.lower().startswith("/stats"):
+                print_stats(app, sm, user_input.lower().split()[1:])
+                continue
+
+            # Send message; the answer streams as it is generated
+            if runner.run(stream_reply(app, tid, user_input)):
+                continue
             
-            # Get response
+            # Nothing streamed (e.g. tool calls only): show the final state
             st = get_state(app, tid)
             if st and st.values and "messages" in st.values:
                 msgs = st.values["messages"]
@@ -110,6 +206,8 @@ def main():
             break
         except Exception as e:
             print(f"Error during chat: {e}")
+    runner.close()
+    app.close()
 
 if __name__ == "__main__":
     main()
@@ -1,3 +1,12 @@
-from .loader import load_context_app
-from .multiuser import SessionManager
+# the public API is imported on first use, so `import contextmgr` stays cheap
+__all__ = ["load_context_app", "SessionManager"]
 
+
+def __getattr__(name):
+    if name == "load_context_app":
+        from .loader import load_context_app
+        return load_context_app
+    if name == "SessionManager":
+        from .multiuser import SessionManager
+        return SessionManager
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,21 +1,204 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import threading
+import time
 import yaml
-from typing import Any, Iterable
-from langchain_community.chat_models import ChatTongyi
-from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_core.messages import BaseMessage, SystemMessage, ToolMessage
-from src.chat_state import ChatState
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import TYPE_CHECKING, Any, Iterable
+from src.app import ToolPool, _ainvoke_tool, _invoke_tool, tool_error, tool_registry
+from src.metrics import Metrics, timer
+from src.query_cache import QueryCache
 from src.retrieval import DocStore
-from src.app import _invoke_tool
+from contextmgr.tokens import estimate_tokens, truncate_to_tokens
 
-def _build_effective_messages(state: ChatState) -> list[BaseMessage]:
-    msgs = []
-    if state.get("system"):
-        msgs.append(SystemMessage(content=state["system"]))
+# LangChain/LangGraph/LlamaIndex are imported where they are used, so importing contextmgr stays cheap
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+    from src.chat_state import ChatState
+
+_TITLES = {"policies": "Policies", "facts": "Facts", "instructions": "Instructions", "examples": "Examples"}
+# a truncated item shorter than this is not worth keeping
+_MIN_TRUNCATED_TOKENS = 16
+
+def _fit_budget(buckets: list[tuple[str, list]], max_tokens: int, truncate: bool, report: dict | None,
+                fill_order: dict[str, list[int]] | None = None) -> list[tuple[str, list]]:
+    """
+    Keep bucket lines in priority order while the estimated token count stays within max_tokens.
+    A line that does not fit is truncated to the remaining budget (truncate=True) or dropped;
+    later, shorter lines may still fit. What was cut is recorded in report.
+    fill_order maps a bucket to the order its line indices are tried in; kept lines stay in display order.
+    """
+    remaining = max_tokens - estimate_tokens("上下文:")
+    dropped: dict[str, int] = {}
+    truncated: dict[str, int] = {}
+    fitted = []
+    for name, lines in buckets:
+        kept: dict[int, str] = {}
+        header = estimate_tokens(f"- {_TITLES.get(name, name)}:") + 1
+        order = (fill_order or {}).get(name)
+        for i in range(len(lines)) if order is None else order:
+            text = str(lines[i])
+            cost = estimate_tokens(text) + 1 + (0 if kept else header)
+            if cost <= remaining:
+                kept[i] = text
+                remaining -= cost
+                continue
+            room = remaining - 1 - (0 if kept else header)
+            if truncate and room >= _MIN_TRUNCATED_TOKENS:
+                kept[i] = truncate_to_tokens(text, room)
+                truncated[name] = truncated.get(name, 0) + 1
+                remaining = 0
+            else:
+                dropped[name] = dropped.get(name, 0) + 1
+        fitted.append((name, [kept[i] for i in sorted(kept)]))
+    if report is not None:
+        report.update({"max_tokens": max_tokens, "used": max_tokens - remaining, "dropped": dropped, "truncated": truncated})
+    return fitted
+
+def _format_fact(doc) -> str:
+    # Source URL Injection if the document carries metadata
+    if hasattr(doc, "metadata") and hasattr(doc, "page_content"):
+        return f"Source: {doc.metadata.get('source', 'unknown')}\nContent: {doc.page_content}"
+    return str(doc)
+
+def _resolve_facts(state: ChatState, resolve) -> list:
+    """Inline facts followed by retrieved chunks, looked up by id at render time."""
+    facts = list(state.get("context_facts") or [])
+    if resolve is None:
+        return facts
+    for cid in state.get("context_fact_ids") or []:
+        doc = resolve(cid)
+        if doc is not None:
+            facts.append(_format_fact(doc))
+    return facts
+
+def _fact_order(state: ChatState, facts: list) -> list[int]:
+    """Budget order of the facts bucket: inline facts, then retrieved chunks newest first."""
+    inline = min(len(state.get("context_facts") or []), len(facts))
+    return list(range(inline)) + list(range(len(facts) - 1, inline - 1, -1))
+
+def _history_window(messages: list, max_messages: int = 0, max_tokens: int = 0) -> int:
+    """
+    Index of the first message inside the last-N / token-capped window. The window starts on a
+    user message so tool calls are never separated from their results; the current turn is always kept.
+    """
+    start, used = len(messages), 0
+    while start > 0:
+        cost = estimate_tokens(str(getattr(messages[start - 1], "content", "")))
+        if (max_messages and len(messages) - start >= max_messages) or (max_tokens and used + cost > max_tokens):
+            break
+        used += cost
+        start -= 1
+    # the current turn stays even when it alone exceeds max_tokens
+    last_human = next((j for j in range(len(messages) - 1, -1, -1) if getattr(messages[j], "type", None) == "human"),
+                      len(messages) - 1)
+    start = min(start, max(last_human, 0))
+    i = start
+    while i < len(messages) and getattr(messages[i], "type", None) != "human":
+        i += 1
+    if i < len(messages):
+        return i
+    while start > 0 and getattr(messages[start], "type", None) != "human":
+        start -= 1
+    return start
+
+def _summary_prompt(summary: str, messages: list) -> list[BaseMessage]:
+    from langchain_core.messages import HumanMessage, SystemMessage
+    lines = [f"{getattr(m, 'type', 'message')}: {getattr(m, 'content', '')}" for m in messages if getattr(m, "content", "")]
+    return [
+        SystemMessage(content="你负责压缩对话历史。请把已有摘要与新增对话合并为一段简洁的摘要，保留关键事实、用户偏好、结论与未完成事项。"),
+        HumanMessage(content=f"已有摘要：\n{summary or '（无）'}\n\n新增对话：\n" + "\n".join(lines)),
+    ]
+
+def _summarize_history(llm, summary: str, messages: list) -> str:
+    """Fold messages that left the window into the running summary with one LLM call."""
+    return str(llm.invoke(_summary_prompt(summary, messages)).content)
+
+async def _asummarize_history(llm, summary: str, messages: list) -> str:
+    return str((await llm.ainvoke(_summary_prompt(summary, messages))).content)
+
+def _render_buckets(buckets: list[tuple[str, list]]) -> str | None:
     # Multi-bucket aggregation into a single contextual SystemMessage (backward compatible with "上下文:")
+    if not any(lines for _, lines in buckets):
+        return None
+    parts: list[str] = ["上下文:"]
+    for name, lines in buckets:
+        if not lines:
+            continue
+        title = _TITLES.get(name, name)
+        parts.append(f"- {title}:")
+        parts.extend([str(line) for line in lines])
+    return "\n".join(parts)
+
+def _merge_reports(first: dict, second: dict) -> dict:
+    merged = {"max_tokens": first.get("max_tokens"), "used": first.get("used", 0) + second.get("used", 0)}
+    for key in ("dropped", "truncated"):
+        counts = dict(first.get(key) or {})
+        for name, n in (second.get(key) or {}).items():
+            counts[name] = counts.get(name, 0) + n
+        merged[key] = counts
+    return merged
+
+class PrefixCache:
+    """
+    Memoized rendering of the static prompt prefix: system plus the policies/instructions/examples
+    buckets. Identical inputs give the same strings, so the prefix stays byte-stable across turns and
+    tool-loop iterations and provider-side prefix caching can reuse it.
+    """
+    def __init__(self, maxsize: int = 64):
+        self._cache = QueryCache(maxsize=maxsize, ttl=0)
+
+    def render(self, system: str | None, buckets: list[tuple[str, list]], budget: dict | None):
+        """(prefix contents, budget report of the static buckets, prefix hash, reused)."""
+        max_tokens = int(budget["max_tokens"]) if budget and budget.get("max_tokens") else 0
+        truncate = bool(budget.get("truncate", True)) if budget else True
+        key = (system or "", tuple((name, tuple(map(str, lines))) for name, lines in buckets), max_tokens, truncate)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return (*cached, True)
+        report: dict = {}
+        if max_tokens:
+            buckets = _fit_budget(buckets, max_tokens, truncate, report)
+        contents = tuple(c for c in (system or None, _render_buckets(buckets)) if c)
+        digest = hashlib.sha1("\x00".join(contents).encode("utf-8")).hexdigest()[:12]
+        self._cache.put(key, (contents, report, digest))
+        return contents, report, digest, False
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+def _cached_tokens(ai) -> int | None:
+    """Prompt tokens the provider served from its prefix cache, when the response reports them."""
+    usage = getattr(ai, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    if "cache_read" in details:
+        return int(details["cache_read"])
+    token_usage = (getattr(ai, "response_metadata", None) or {}).get("token_usage") or {}
+    cached = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    return int(cached) if cached is not None else None
+
+def _build_effective_messages(state: ChatState, budget: dict | None = None, report: dict | None = None,
+                              resolve=None, history_start: int = 0, prefix: PrefixCache | None = None,
+                              prefix_info: dict | None = None) -> list[BaseMessage]:
+    """
+    Render the prompt: system, one "上下文:" message with the buckets in priority order,
+    the procedure guide, the history summary, then the conversation from history_start on.
+    Retrieved facts are stored as chunk ids and turned back into text through resolve(chunk_id)
+    (DocStore.get_chunk). With budget={"max_tokens": N, "truncate": bool} the buckets are cut
+    to fit N estimated tokens and report receives what was cut.
+    With a PrefixCache, the static buckets are rendered (and budgeted) first as a memoized prefix
+    and the facts follow in their own message with the remaining budget; prefix_info receives
+    the prefix hash and whether it was reused.
+    """
+    from langchain_core.messages import SystemMessage
+    msgs = []
+    facts = _resolve_facts(state, resolve)
+    # a full budget drops chunks of earlier turns before those retrieved for the current one
+    fill_order = {"facts": _fact_order(state, facts)}
     buckets = [
         ("policies", state.get("context_policies") or []),
-        ("facts", state.get("context_facts") or []),
+        ("facts", facts),
         ("instructions", state.get("context_instructions") or []),
         ("examples", state.get("context_examples") or []),
     ]
@@ -23,47 +206,72 @@ def _build_effective_messages(state: ChatState) -> list[BaseMessage]:
     priority = state.get("context_priority") or ["policies", "facts", "instructions", "examples"]
     order = {name: i for i, name in enumerate(priority)}
     buckets.sort(key=lambda x: order.get(x[0], 999))
-    has_any = any(len(lines) > 0 for _, lines in buckets)
-    if has_any:
-        parts: list[str] = ["上下文:"]
-        for name, lines in buckets:
-            if not lines:
-                continue
-            title = {"policies": "Policies", "facts": "Facts", "instructions": "Instructions", "examples": "Examples"}.get(name, name)
-            parts.append(f"- {title}:")
-            parts.extend([str(line) for line in lines])
-        msgs.append(SystemMessage(content="\n".join(parts)))
+    budgeted = bool(budget and budget.get("max_tokens"))
+    if prefix is not None:
+        static = [(name, lines) for name, lines in buckets if name != "facts"]
+        contents, static_report, digest, reused = prefix.render(state.get("system"), static, budget)
+        msgs.extend(SystemMessage(content=c) for c in contents)
+        facts = [(name, lines) for name, lines in buckets if name == "facts"]
+        if budgeted:
+            facts_report: dict = {}
+            facts = _fit_budget(facts, int(budget["max_tokens"]) - static_report.get("used", 0),
+                                bool(budget.get("truncate", True)), facts_report, fill_order)
+            if not any(lines for _, lines in facts):
+                # no facts message is rendered, so its header costs nothing
+                facts_report["used"] = 0
+            if report is not None:
+                report.update(_merge_reports(static_report, facts_report))
+        rendered = _render_buckets(facts)
+        if rendered:
+            msgs.append(SystemMessage(content=rendered))
+        if prefix_info is not None:
+            prefix_info.update({"hash": digest, "reused": reused, "tokens": sum(estimate_tokens(c) for c in contents)})
+    else:
+        if state.get("system"):
+            msgs.append(SystemMessage(content=state["system"]))
+        if budgeted:
+            buckets = _fit_budget(buckets, int(budget["max_tokens"]), bool(budget.get("truncate", True)), report,
+                                  fill_order)
+        rendered = _render_buckets(buckets)
+        if rendered:
+            msgs.append(SystemMessage(content=rendered))
     if state.get("procedure_enabled") and (state.get("procedure_steps") or []):
         steps = state.get("procedure_steps") or []
         idx = (state.get("procedure_step") or 0)
         cur = steps[idx] if idx < len(steps) else None
         guide = f"执行流程（共{len(steps)}步）：当前第{idx+1}步 -> {cur}. 必须按步骤输出。"
         msgs.append(SystemMessage(content=guide))
-    msgs.extend(state.get("messages") or [])
+    if state.get("history_summary"):
+        msgs.append(SystemMessage(content=f"此前对话摘要：\n{state['history_summary']}"))
+    messages = state.get("messages") or []
+    msgs.extend(messages[history_start:] if history_start else messages)
     return msgs
 
-def load_context_app(config_path: str, tools: Iterable[object] | None = None, model: str | None = None):
-    with open(config_path, "r", encoding="utf-8") as f:
-        cfg = yaml.safe_load(f)
-    # model configuration is decoupled from YAML; respect provided arg or fallback
-    llm = ChatTongyi(model=model or "qwen-plus")
-    if tools and hasattr(llm, "bind_tools"):
-        llm = llm.bind_tools(list(tools))
-    ds = DocStore()
+# top-level config keys reload() applies to a running app
+_RELOADABLE = {"system", "context", "sticky_docs", "persona", "doc_files", "doc_dirs", "kb", "namespaces",
+               "procedure", "procedure_enabled", "procedure_steps", "reload"}
+
+def _sticky_docs(cfg: dict) -> list[str]:
     # sticky docs: support both new and legacy keys
     sticky_list = list(cfg.get("sticky_docs") or [])
     persona = cfg.get("persona") or {}
     sticky_list += list(persona.get("sticky") or [])
-    for t in sticky_list or []:
-        ds.add_sticky(str(t))
+    return [str(t) for t in sticky_list]
+
+def _kb_sources(cfg: dict) -> tuple[list, list]:
     # kb files/dirs: support both new and legacy keys
     kb = cfg.get("kb") or {}
     files_list = list(cfg.get("doc_files") or []) + list(kb.get("files") or [])
     dirs_list = list(cfg.get("doc_dirs") or []) + list(kb.get("dirs") or [])
-    for p in files_list or []:
-        ds.add_file(str(p))
-    for d in dirs_list or []:
-        ds.add_dir(str(d))
+    return files_list, dirs_list
+
+def _namespace_sources(cfg: dict) -> dict[str, tuple[list, list]]:
+    """Per-namespace knowledge bases: `namespaces: {name: {files, dirs}}`."""
+    return {str(name): (list((spec or {}).get("files") or []), list((spec or {}).get("dirs") or []))
+            for name, spec in (cfg.get("namespaces") or {}).items()}
+
+def _seed_values(cfg: dict) -> dict[str, Any]:
+    """State a new thread starts from: system, context buckets, priority and procedure."""
     initial_system = cfg.get("system")
     # multi-bucket context initialization: support legacy flat context and new buckets
     raw_ctx = cfg.get("context")
@@ -78,100 +286,486 @@ def load_context_app(config_path: str, tools: Iterable[object] | None = None, mo
     # procedure: support legacy and new nested
     procedure_enabled = bool(cfg.get("procedure_enabled") or (cfg.get("procedure") or {}).get("enabled") or False)
     procedure_steps = (cfg.get("procedure") or {}).get("steps") or cfg.get("procedure_steps") or []
+    seed_values: dict[str, Any] = {}
+    if initial_system:
+        seed_values["system"] = initial_system
+    # set multi-bucket
+    if initial_policies:
+        seed_values["context_policies"] = initial_policies
+    if initial_facts:
+        seed_values["context_facts"] = initial_facts
+    if initial_instructions:
+        seed_values["context_instructions"] = initial_instructions
+    if initial_examples:
+        seed_values["context_examples"] = initial_examples
+    if initial_priority:
+        seed_values["context_priority"] = initial_priority
+    if procedure_enabled:
+        seed_values["procedure_enabled"] = True
+        if procedure_steps:
+            seed_values["procedure_steps"] = list(procedure_steps)
+            seed_values["procedure_step"] = 0
+    return seed_values
+
+def _watch(config_path: str, reload, interval: float) -> threading.Thread:
+    """Daemon thread calling reload() when the config file or a file under its doc_files/doc_dirs changes."""
+    import os
+    from src.ingest import expand_sources
+
+    def state():
+        with open(config_path, "r", encoding="utf-8") as f:
+            cfg = yaml.safe_load(f) or {}
+        files, dirs = _kb_sources(cfg)
+        for ns_files, ns_dirs in _namespace_sources(cfg).values():
+            files, dirs = files + ns_files, dirs + ns_dirs
+        paths = expand_sources(files, dirs, {})
+        stats = {}
+        for p in [config_path, *paths]:
+            try:
+                st = os.stat(p)
+                stats[p] = (st.st_mtime, st.st_size)
+            except OSError:
+                continue
+        return stats
+
+    def run():
+        last = None
+        while True:
+            try:
+                current = state()
+                if last is not None and current != last:
+                    result = reload()
+                    print(f"Reloaded {config_path}: {result['report'].summary()}")
+                last = current
+            except Exception as e:
+                print(f"Warning: reload failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="context-reload", daemon=True)
+    thread.start()
+    return thread
+
+def _make_metrics(settings: dict) -> Metrics | None:
+    """Metrics from the YAML `metrics` block (on by default); exporter is a "module:function" path."""
+    if not settings.get("enabled", True):
+        return None
+    metrics = Metrics(
+        profile_sample=float(settings.get("profile_sample", 0.0)),
+        profile_dir=settings.get("profile_dir"),
+        profile_top=int(settings.get("profile_top", 15)),
+    )
+    for path in settings.get("exporters") or []:
+        try:
+            import importlib
+            module, _, attr = str(path).partition(":")
+            metrics.add_exporter(getattr(importlib.import_module(module), attr))
+        except Exception as e:
+            print(f"Warning: failed to load metrics exporter {path}: {e}")
+    return metrics
+
+class _Lazy:
+    """Builds a value on first get(); used for the LLM client, whose import and setup cost startup time."""
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value = None
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = self._factory()
+        return self._value
+
+def load_context_app(config_path: str, tools: Iterable[object] | None = None, model: str | None = None, progress=None,
+                     llm=None, embed_model=None):
+    """
+    Build the LangGraph app from a YAML config. Returns (app, seed, ds).
+    llm replaces the default ChatTongyi(model) client and embed_model the LlamaIndex Settings.embed_model,
+    e.g. with the deterministic stand-ins in bench/fakes.py for offline runs.
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    from langchain_core.messages import ToolMessage
+    from langchain_core.runnables import RunnableLambda
+    from langgraph.graph import StateGraph, END
+    from src.chat_state import ChatState, drop_head
+    tools = list(tools or [])
+
+    injected_llm = llm
+
+    def make_llms():
+        from langgraph.constants import TAG_NOSTREAM
+        if injected_llm is not None:
+            llm = injected_llm
+        else:
+            from langchain_community.chat_models import ChatTongyi
+            # model configuration is decoupled from YAML; respect provided arg or fallback
+            llm = ChatTongyi(model=model or "qwen-plus")
+        # summaries are internal: keep their tokens out of stream_mode="messages"
+        summary_llm = llm.with_config(tags=[TAG_NOSTREAM]) if hasattr(llm, "with_config") else llm
+        if tools and hasattr(llm, "bind_tools"):
+            llm = llm.bind_tools(list(tools))
+        return llm, summary_llm
+
+    # the client is created on the first LLM call, not at startup
+    llms = _Lazy(make_llms)
+    metrics = _make_metrics(cfg.get("metrics") or {})
+    # embedding cache is optional; unchanged chunks are served from disk across restarts
+    retrieval = cfg.get("retrieval") or {}
+    ingest = cfg.get("ingest") or {}
+    snapshot_dir = cfg.get("snapshot_dir")
+    ds = DocStore(
+        embed_cache_path=cfg.get("embed_cache"),
+        embed_model=embed_model,
+        retrieval_mode=str(retrieval.get("mode") or "vector"),
+        alpha=float(retrieval.get("alpha", 0.5)),
+        lexical_skip=float(retrieval.get("lexical_skip", 0.9)),
+        lexical_candidates=int(retrieval.get("lexical_candidates", 0)),
+        cache_size=int(retrieval.get("cache_size", 256)),
+        cache_ttl=float(retrieval.get("cache_ttl", 300)),
+        ingest_workers=ingest.get("workers"),
+        embed_batch=int(ingest.get("embed_batch", 64)),
+        embed_concurrency=int(ingest.get("embed_concurrency", 4)),
+        chunk_size=int(ingest.get("chunk_size", 1024)),
+        chunk_overlap=int(ingest.get("chunk_overlap", 200)),
+        stream=bool(ingest.get("stream") or False),
+        stream_batch=int(ingest.get("batch_size", 512)),
+        # streamed windows go straight into the snapshot directory when one is configured
+        spill_dir=str(snapshot_dir) if snapshot_dir else None,
+        dedup_distance=int(ingest.get("dedup_distance", 3)),
+        metrics=metrics,
+    )
+    for t in _sticky_docs(cfg):
+        ds.add_sticky(t)
+    files_list, dirs_list = _kb_sources(cfg)
+    namespace_sources = _namespace_sources(cfg)
+
+    def build_index():
+        # a saved snapshot is memory-mapped instead of re-ingesting the knowledge base,
+        # then brought in line with files edited, added or deleted while the app was down
+        if snapshot_dir and ds.load_snapshot(str(snapshot_dir)):
+            report = ds.refresh(files_list, dirs_list, progress=progress, namespaces=namespace_sources)
+            if report.chunks or report.removed:
+                ds.save_snapshot(str(snapshot_dir))
+        else:
+            # one staged pipeline over the shared sources; per-file errors are kept in ds.last_report
+            report = ds.ingest(files_list, dirs_list, progress=progress)
+            # tenant knowledge bases go into the same index, tagged with their namespace
+            for name, (ns_files, ns_dirs) in namespace_sources.items():
+                report.merge(ds.ingest(ns_files, ns_dirs, progress=progress, namespace=name))
+            ds.last_report = report
+            if snapshot_dir:
+                ds.save_snapshot(str(snapshot_dir))
+
+    if ingest.get("background"):
+        # the app is usable right away; retrieval waits only if it runs before the index is ready
+        ds.build_in_background(build_index)
+    else:
+        build_index()
+    # values seed() writes into a new thread; reload() replaces the dict as a whole
+    seeds = {"values": _seed_values(cfg)}
+    # optional token budget for the context buckets: {max_tokens, truncate}
+    context_budget = cfg.get("context_budget") or {}
+    # history policy: last-N window, token cap, optional rolling summary of older turns
+    history = cfg.get("history") or {}
+    history_max_messages = int(history.get("max_messages") or 0)
+    history_max_tokens = int(history.get("max_tokens") or 0)
+    history_summarize = bool(history.get("summarize") or False)
+    history_fold_every = max(1, int(history.get("fold_every") or 6))
+    history_prune = bool(history.get("prune") or False)
+    # static prompt prefix (system, policies, instructions, examples) is memoized and kept byte-stable
+    prompt_cache = cfg.get("prompt_cache") or {}
+    prefix_cache = PrefixCache(int(prompt_cache.get("maxsize", 64))) if prompt_cache.get("stable_prefix", True) else None
+    # concurrent async turns share one embedding call and one scoring pass per batch window
+    batcher = None
+    if float(retrieval.get("batch_window_ms", 0)) > 0:
+        from src.batching import RetrievalBatcher
+        batcher = RetrievalBatcher(ds, window=float(retrieval["batch_window_ms"]) / 1000,
+                                   max_batch=int(retrieval.get("batch_max", 32)),
+                                   max_pending=int(retrieval.get("batch_queue", 256)), metrics=metrics)
+    # tool execution: name -> tool index, per-call timeouts (seconds, 0 = none), bounded worker pool
+    registry = tool_registry(tools)
+    tool_calls = cfg.get("tool_calls") or {}
+    tool_timeout = float(tool_calls.get("timeout", 30))
+    tool_timeouts = {str(k): float(v) for k, v in (tool_calls.get("timeouts") or {}).items()}
+    tool_workers = int(tool_calls.get("workers", 8))
+    # daemon threads, only started on first use; a hung tool does not block process exit
+    tool_pool = ToolPool(max_workers=max(1, tool_workers), thread_name_prefix="tool")
+
+    def _history_plan(state: ChatState) -> tuple[int, int]:
+        """(window start, leading messages already folded into the summary) under the history policy."""
+        if not (history_max_messages or history_max_tokens):
+            return 0, 0
+        start = _history_window(state.get("messages") or [], history_max_messages, history_max_tokens)
+        return start, min(state.get("history_summarized") or 0, start)
+
+    def _should_fold(start: int, summarized: int) -> bool:
+        # fold in batches so the summary costs one extra LLM call every few turns, not every turn
+        return history_summarize and start - summarized >= history_fold_every
+
+    def _folded(state: ChatState, summary: str, start: int, update: dict, new_messages: list) -> ChatState:
+        update["history_summary"] = summary
+        if history_prune:
+            # folded messages leave the state too; the next turn starts from the window
+            new_messages.append(drop_head(start))
+        update["history_summarized"] = 0 if history_prune else start
+        return {**state, "history_summary": summary}
+
+    def _render(state: ChatState, start: int, summarized: int, trimmed: dict, info: dict) -> list[BaseMessage]:
+        # with a summary, unfolded messages stay visible until the next fold
+        msgs = _build_effective_messages(state, context_budget, trimmed, ds.get_chunk,
+                                         summarized if history_summarize else start, prefix_cache, info)
+        if metrics is not None:
+            texts = [str(m.content) for m in msgs]
+            metrics.observe("prompt.messages", len(msgs))
+            metrics.observe("prompt.chars", sum(len(t) for t in texts))
+            metrics.observe("prompt.tokens", sum(estimate_tokens(t) for t in texts))
+        return msgs
+
+    def _reply(ai, update: dict, new_messages: list, trimmed: dict, info: dict) -> dict:
+        update["messages"] = new_messages + [ai]
+        if trimmed:
+            update["context_trimmed"] = trimmed
+        if info:
+            cached = _cached_tokens(ai)
+            if cached is not None:
+                info["cached_tokens"] = cached
+            update["prompt_prefix"] = info
+        return update
 
     def chat_llm(state: ChatState):
-        effective = _build_effective_messages(state)
-        ai = llm.invoke(effective)
-        return {"messages": [ai]}
+        update: dict[str, Any] = {}
+        new_messages: list = []
+        start, summarized = _history_plan(state)
+        if _should_fold(start, summarized):
+            try:
+                summary = _summarize_history(llms.get()[1], state.get("history_summary") or "", state["messages"][summarized:start])
+                state, summarized = _folded(state, summary, start, update, new_messages), start
+            except Exception as e:
+                print(f"Warning: history summarization failed: {e}")
+                # still apply the window; the fold is retried next turn since history_summarized is unchanged
+                summarized = start
+        trimmed: dict = {}
+        info: dict = {}
+        msgs = _render(state, start, summarized, trimmed, info)
+        with timer(metrics, "llm"):
+            ai = llms.get()[0].invoke(msgs)
+        return _reply(ai, update, new_messages, trimmed, info)
+
+    async def achat_llm(state: ChatState):
+        update: dict[str, Any] = {}
+        new_messages: list = []
+        start, summarized = _history_plan(state)
+        if _should_fold(start, summarized):
+            try:
+                summary = await _asummarize_history(llms.get()[1], state.get("history_summary") or "", state["messages"][summarized:start])
+                state, summarized = _folded(state, summary, start, update, new_messages), start
+            except Exception as e:
+                print(f"Warning: history summarization failed: {e}")
+                # still apply the window; the fold is retried next turn since history_summarized is unchanged
+                summarized = start
+        trimmed: dict = {}
+        info: dict = {}
+        # under astream(stream_mode="messages") the model streams its tokens through the callbacks
+        msgs = _render(state, start, summarized, trimmed, info)
+        with timer(metrics, "llm"):
+            ai = await llms.get()[0].ainvoke(msgs)
+        return _reply(ai, update, new_messages, trimmed, info)
+
+    def _timeout_for(name: str) -> float:
+        return float(tool_timeouts.get(name, tool_timeout) or 0)
 
     def run_tools(state: ChatState):
+        # calls run in parallel on a shared pool; results keep the order of the model's tool_calls
         last = state["messages"][-1]
         calls = getattr(last, "tool_calls", None) or []
-        results: list[ToolMessage] = []
-        for call in calls:
-            name = call.get("name")
-            args = call.get("args") or {}
-            if tools:
-                for t in tools:
-                    key = getattr(t, "name", None) or getattr(t, "__name__", None) or str(t)
-                    if key == name:
-                        out = _invoke_tool(t, args)
-                        results.append(ToolMessage(content=str(out), tool_call_id=call.get("id") or ""))
-                        break
+        results: list[ToolMessage | None] = [None] * len(calls)
+        futures = {}
+        for i, call in enumerate(calls):
+            t = registry.get(call.get("name"))
+            if t is None:
+                results[i] = tool_error(call, f"unknown tool {call.get('name')}")
+            elif len(calls) == 1 and not _timeout_for(call.get("name")):
+                results[i] = ToolMessage(content=str(_invoke_tool(t, call.get("args") or {})), tool_call_id=call.get("id") or "")
+            else:
+                futures[i] = tool_pool.submit(_invoke_tool, t, call.get("args") or {})
+        started = time.monotonic()
+        for i, fut in futures.items():
+            call = calls[i]
+            limit = _timeout_for(call.get("name"))
+            try:
+                out = fut.result(timeout=max(0.0, started + limit - time.monotonic()) if limit else None)
+                results[i] = ToolMessage(content=str(out), tool_call_id=call.get("id") or "")
+            except FutureTimeout:
+                # the worker cannot be interrupted; it finishes in the background and its result is discarded
+                fut.cancel()
+                results[i] = tool_error(call, f"tool {call.get('name')} timed out after {limit:g}s")
         return {"messages": results}
 
+    async def arun_tools(state: ChatState):
+        last = state["messages"][-1]
+        calls = getattr(last, "tool_calls", None) or []
+
+        async def one(call: dict) -> ToolMessage:
+            t = registry.get(call.get("name"))
+            if t is None:
+                return tool_error(call, f"unknown tool {call.get('name')}")
+            limit = _timeout_for(call.get("name"))
+            try:
+                # sync tools share the bounded tool_pool with run_tools; a timed-out one is left running there
+                out = await asyncio.wait_for(_ainvoke_tool(t, call.get("args") or {}, tool_pool), limit or None)
+            except asyncio.TimeoutError:
+                return tool_error(call, f"tool {call.get('name')} timed out after {limit:g}s")
+            return ToolMessage(content=str(out), tool_call_id=call.get("id") or "")
+
+        return {"messages": list(await asyncio.gather(*(one(c) for c in calls)))}
+
+    def _query(state: ChatState) -> str:
+        return str(getattr(state["messages"][-1], "content", ""))
+
     def prepare_ctx(state: ChatState):
+        return _merge_context(state, ds.retrieve(_query(state), namespace=state.get("namespace")))
+
+    async def aprepare_ctx(state: ChatState):
+        # a thread's namespace (set by seed) limits retrieval to that tenant's chunks and the shared ones
+        if batcher is not None:
+            return _merge_context(state, await batcher.retrieve(_query(state), namespace=state.get("namespace")))
+        return _merge_context(state, await ds.aretrieve(_query(state), namespace=state.get("namespace")))
+
+    def _merge_context(state: ChatState, retrieved: list):
         # existing buckets
         policies = list(state.get("context_policies") or [])
         facts = list(state.get("context_facts") or [])
-        instructions = list(state.get("context_instructions") or [])
-        examples = list(state.get("context_examples") or [])
-        # retrieval
-        last = state["messages"][-1]
-        query = getattr(last, "content", "")
-        # sticky -> policies; retrieval -> facts
+        fact_ids = list(state.get("context_fact_ids") or [])
+        # sticky -> policies; retrieval -> chunk ids (text is resolved from ds at render time)
+        seen_policies = set(policies)
         for d in ds.sticky():
-            if d not in policies:
+            if d not in seen_policies:
+                seen_policies.add(d)
                 policies.append(d)
-        for d in ds.retrieve(str(query)):
-            # Support Source URL Injection if DocStore returns objects with metadata
-            if hasattr(d, "metadata") and hasattr(d, "page_content"):
-                source = d.metadata.get("source", "unknown")
-                content = d.page_content
-                formatted = f"Source: {source}\nContent: {content}"
-                if formatted not in facts:
-                    facts.append(formatted)
-            else:
-                if d not in facts:
-                    facts.append(d)
-        # aggregate view "context" for backward compatibility, ordered by priority
+        seen_ids = set(fact_ids)
+        seen_facts = set(facts)
+        for d in retrieved:
+            cid = getattr(d, "metadata", {}).get("chunk_id")
+            if cid:
+                # a chunk retrieved again moves to the end, where the newest facts are
+                if cid in seen_ids:
+                    fact_ids.remove(cid)
+                seen_ids.add(cid)
+                fact_ids.append(cid)
+                continue
+            # objects without a chunk id keep the old inline formatting
+            formatted = _format_fact(d)
+            if formatted not in seen_facts:
+                seen_facts.add(formatted)
+                facts.append(formatted)
+        # aggregate view "context" for backward compatibility, ordered by priority; facts are listed by chunk id
         priority = state.get("context_priority") or ["policies", "facts", "instructions", "examples"]
-        bucket_map = {"policies": policies, "facts": facts, "instructions": instructions, "examples": examples}
-        merged: list[str] = []
-        for name in priority:
-            for d in bucket_map.get(name, []):
-                if d not in merged:
-                    merged.append(d)
-        return {
-            "context_policies": policies,
-            "context_facts": facts,
-            "context_instructions": instructions,
-            "context_examples": examples,
-            "context": merged,
+        bucket_map = {
+            "policies": policies,
+            "facts": facts + fact_ids,
+            "instructions": state.get("context_instructions") or [],
+            "examples": state.get("context_examples") or [],
         }
+        merged = list(dict.fromkeys(d for name in priority for d in bucket_map.get(name, [])))
+        # only changed channels are returned, so unchanged buckets are not re-checkpointed
+        update: dict[str, Any] = {}
+        if merged != list(state.get("context") or []):
+            update["context"] = merged
+        if len(policies) != len(state.get("context_policies") or []):
+            update["context_policies"] = policies
+        if len(facts) != len(state.get("context_facts") or []):
+            update["context_facts"] = facts
+        if fact_ids != list(state.get("context_fact_ids") or []):
+            update["context_fact_ids"] = fact_ids
+        return update
 
     builder = StateGraph(ChatState)
-    builder.add_node("prepare_ctx", prepare_ctx)
-    builder.add_node("chat_llm", chat_llm)
-    builder.add_node("run_tools", run_tools)
+    # each node has a sync and an async body, so app.invoke and app.ainvoke/astream both work
+    for name, func, afunc in (("prepare_ctx", prepare_ctx, aprepare_ctx), ("chat_llm", chat_llm, achat_llm),
+                              ("run_tools", run_tools, arun_tools)):
+        if metrics is not None:
+            func, afunc = metrics.timed(f"node.{name}", func), metrics.timed(f"node.{name}", afunc)
+        builder.add_node(name, RunnableLambda(func, afunc=afunc, name=name))
     builder.add_edge("prepare_ctx", "chat_llm")
     builder.add_edge("run_tools", "chat_llm")
     builder.set_entry_point("prepare_ctx")
     builder.add_conditional_edges("chat_llm", lambda s: "run_tools" if getattr(s["messages"][-1], "tool_calls", None) else END)
-    checkpointer = MemorySaver()
+    # conversation state: in memory by default, or deltas in a local SQLite file shared across restarts/processes
+    checkpoint = cfg.get("checkpoint") or {}
+    if checkpoint.get("path"):
+        from src.checkpoint import SQLiteDeltaSaver
+        checkpointer = SQLiteDeltaSaver(
+            str(checkpoint["path"]),
+            batch=int(checkpoint.get("batch", 16)),
+            interval=float(checkpoint.get("interval", 1.0)),
+            max_chain=int(checkpoint.get("max_chain", 64)),
+        )
+        if checkpoint.get("keep_last"):
+            checkpointer.compact(int(checkpoint["keep_last"]))
+    else:
+        from langgraph.checkpoint.memory import MemorySaver
+        checkpointer = MemorySaver()
     app = builder.compile(checkpointer=checkpointer)
+    # process-wide prefix reuse: app.prefix_cache.stats() -> hits/misses/hit_rate
+    app.prefix_cache = prefix_cache
+    # per-node/DocStore/checkpoint timings and cache hit rates: app.metrics.snapshot() / .report()
+    app.metrics = metrics
+    app.retrieval_batcher = batcher
+    if metrics is not None:
+        if hasattr(checkpointer, "metrics"):
+            checkpointer.metrics = metrics
+        metrics.add_source("query_cache", ds.cache_stats)
+        if batcher is not None:
+            metrics.add_source("retrieval_batcher", batcher.stats)
+        if prefix_cache is not None:
+            metrics.add_source("prefix_cache", prefix_cache.stats)
 
     # Seed initial state if provided
-    def seed(thread_id: str):
-        seed_values: dict[str, Any] = {}
-        if initial_system:
-            seed_values["system"] = initial_system
-        # set multi-bucket
-        if initial_policies:
-            seed_values["context_policies"] = list(initial_policies)
-        if initial_facts:
-            seed_values["context_facts"] = list(initial_facts)
-        if initial_instructions:
-            seed_values["context_instructions"] = list(initial_instructions)
-        if initial_examples:
-            seed_values["context_examples"] = list(initial_examples)
-        if initial_priority:
-            seed_values["context_priority"] = list(initial_priority)
-        if procedure_enabled:
-            seed_values["procedure_enabled"] = True
-            if procedure_steps:
-                seed_values["procedure_steps"] = list(procedure_steps)
-                seed_values["procedure_step"] = 0
+    def seed(thread_id: str, namespace: str | None = None):
+        seed_values = {k: list(v) if isinstance(v, list) else v for k, v in seeds["values"].items()}
+        if namespace:
+            seed_values["namespace"] = str(namespace)
         if seed_values:
             app.update_state({"configurable": {"thread_id": thread_id}}, seed_values)
+
+    reload_lock = threading.Lock()
+
+    def reload() -> dict:
+        """
+        Re-read config_path and apply it to the running app: new seed values (used by later seed() calls),
+        sticky docs, and an incremental refresh of doc_files/doc_dirs and namespaces. Turns in flight keep the old
+        index until the new one is swapped in. Other keys take effect at the next start.
+        """
+        nonlocal cfg
+        with reload_lock:
+            with open(config_path, "r", encoding="utf-8") as f:
+                new_cfg = yaml.safe_load(f) or {}
+            values = _seed_values(new_cfg)
+            seed_changed = values != seeds["values"]
+            seeds["values"] = values
+            ds.set_sticky(_sticky_docs(new_cfg))
+            files, dirs = _kb_sources(new_cfg)
+            report = ds.refresh(files, dirs, progress=progress, namespaces=_namespace_sources(new_cfg))
+            if snapshot_dir and (report.chunks or report.removed):
+                ds.save_snapshot(str(snapshot_dir))
+            restart = sorted(k for k in set(cfg) | set(new_cfg)
+                             if k not in _RELOADABLE and cfg.get(k) != new_cfg.get(k))
+            if restart:
+                print(f"Warning: changes to {', '.join(restart)} take effect after a restart")
+            cfg = new_cfg
+            return {"report": report, "seed_changed": seed_changed, "restart_required": restart}
+
+    # reload on edits: poll the config file and the knowledge base sources
+    reload_cfg = cfg.get("reload") or {}
+    if reload_cfg.get("watch"):
+        _watch(config_path, reload, float(reload_cfg.get("interval", 2.0)))
+    app.reload = reload
+
+    def close():
+        """Release the app's workers: queued tool calls are cancelled and running ones abandoned."""
+        tool_pool.shutdown(wait=False, cancel_futures=True)
+
+    app.close = close
     return app, seed, ds
@@ -1,11 +1,145 @@
-from typing import Dict
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
 
 class SessionManager:
-    def __init__(self):
-        self._map: Dict[str, str] = {}
+    """
+    Maps user ids to thread ids. With an app and a capacity and/or idle_ttl, it also bounds how many
+    threads stay resident in the checkpointer: the least recently used (or idle) sessions are
+    evicted and come back transparently on the user's next thread_for().
+    An in-memory checkpointer has the latest checkpoint spilled to spill_dir and the thread deleted;
+    a persistent one (SQLiteDeltaSaver) only drops its per-thread caches.
+    """
+    def __init__(self, app=None, capacity: int = 0, idle_ttl: float = 0.0, spill_dir: str | None = None):
+        self.app = app
+        self.capacity = capacity
+        self.idle_ttl = idle_ttl
+        self.spill_dir = spill_dir
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self.evictions = 0
+        self.rehydrations = 0
+        self._lock = threading.RLock()
+        # thread id -> last use (monotonic), least recently used first
+        self._resident: OrderedDict[str, float] = OrderedDict()
+        self._pinned: dict[str, int] = {}
+
+    @property
+    def _bounded(self) -> bool:
+        return self.app is not None and bool(self.capacity or self.idle_ttl)
 
     def thread_for(self, user_id: str) -> str:
-        if user_id not in self._map:
-            self._map[user_id] = f"u:{user_id}"
-        return self._map[user_id]
+        tid = f"u:{user_id}"
+        if not self._bounded:
+            return tid
+        with self._lock:
+            if tid not in self._resident:
+                self._rehydrate(tid)
+            self._resident[tid] = time.monotonic()
+            self._resident.move_to_end(tid)
+            self.sweep()
+        return tid
+
+    @contextmanager
+    def session(self, user_id: str):
+        """thread_for() that keeps the session resident until the block exits (for concurrent servers)."""
+        with self._lock:
+            tid = self.thread_for(user_id)
+            self._pinned[tid] = self._pinned.get(tid, 0) + 1
+        try:
+            yield tid
+        finally:
+            with self._lock:
+                self._pinned[tid] -= 1
+                if not self._pinned[tid]:
+                    del self._pinned[tid]
+                if tid in self._resident:
+                    self._resident[tid] = time.monotonic()
+                    self._resident.move_to_end(tid)
+
+    def sweep(self) -> int:
+        """Evict idle sessions and, beyond capacity, the least recently used ones. Returns how many were evicted."""
+        if not self._bounded:
+            return 0
+        evicted = 0
+        with self._lock:
+            now = time.monotonic()
+            for tid, used in list(self._resident.items()):
+                over = self.capacity and len(self._resident) > self.capacity
+                idle = self.idle_ttl and now - used >= self.idle_ttl
+                if not (over or idle):
+                    # everything after this entry was used more recently
+                    break
+                if tid in self._pinned:
+                    continue
+                self._evict(tid)
+                evicted += 1
+        return evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            spilled = len(os.listdir(self.spill_dir)) if self.spill_dir and os.path.isdir(self.spill_dir) else 0
+            return {
+                "resident": len(self._resident),
+                "pinned": len(self._pinned),
+                "spilled": spilled,
+                "evictions": self.evictions,
+                "rehydrations": self.rehydrations,
+                "capacity": self.capacity,
+                "idle_ttl": self.idle_ttl,
+            }
+
+    def _spill_path(self, tid: str) -> str:
+        return os.path.join(self.spill_dir, hashlib.sha1(tid.encode("utf-8")).hexdigest() + ".ckpt")
+
+    def _evict(self, tid: str):
+        checkpointer = self.app.checkpointer
+        config = {"configurable": {"thread_id": tid, "checkpoint_ns": ""}}
+        del self._resident[tid]
+        self.evictions += 1
+        if hasattr(checkpointer, "evict"):
+            # state is already durable; only the in-process copy goes
+            checkpointer.evict(tid)
+            return
+        if not self.spill_dir:
+            print(f"Warning: session {tid} evicted without spill_dir; its state is dropped")
+            checkpointer.delete_thread(tid)
+            return
+        saved = checkpointer.get_tuple(config)
+        if saved is not None:
+            record = {
+                "thread_id": tid,
+                "checkpoint": checkpointer.serde.dumps_typed(saved.checkpoint),
+                "metadata": checkpointer.serde.dumps_typed(saved.metadata),
+            }
+            tmp = self._spill_path(tid) + ".tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(record, f)
+            os.replace(tmp, self._spill_path(tid))
+        checkpointer.delete_thread(tid)
 
+    def _rehydrate(self, tid: str):
+        if not self.spill_dir or hasattr(self.app.checkpointer, "evict"):
+            return
+        path = self._spill_path(tid)
+        if not os.path.exists(path):
+            return
+        checkpointer = self.app.checkpointer
+        try:
+            with open(path, "rb") as f:
+                record = pickle.load(f)
+            checkpoint = checkpointer.serde.loads_typed(record["checkpoint"])
+            metadata = checkpointer.serde.loads_typed(record["metadata"])
+            config = {"configurable": {"thread_id": tid, "checkpoint_ns": ""}}
+            # every channel is written again, as of the spilled checkpoint
+            checkpointer.put(config, checkpoint, metadata, dict(checkpoint["channel_versions"]))
+        except Exception as e:
+            print(f"Warning: failed to rehydrate session {tid}: {e}")
+            return
+        os.remove(path)
+        self.rehydrations += 1
@@ -0,0 +1,258 @@
+"""
+Local serving mode: one process answers many users over HTTP, sharing one app, index and checkpointer.
+
+  python -m contextmgr.server --config configs/context.yaml --port 8765    # needs uvicorn
+
+  POST /v1/chat   {"user": "alice", "message": "...", "stream": false, "namespace": null}
+                  -> {"thread_id": "u:alice", "reply": "..."}; with "stream": true, server-sent events
+                     `data: {"token": "..."}` followed by `event: done`; with "namespace": "team-a" the
+                     user's thread is "u:team-a/alice" and retrieves from team-a's and the shared chunks;
+                     without one, from the shared chunks only
+  GET  /v1/stats  metrics snapshot, sessions and retrieval batching
+  POST /v1/reload re-read the config and refresh the knowledge base incrementally (app.reload())
+  GET  /healthz   {"ready": <index built>}
+
+Turns of one user run one at a time in arrival order; different users run concurrently, at most
+server.max_turns at once. A user with server.max_queued_per_thread turns waiting, or a server with
+server.max_waiting turns waiting, gets 429 with Retry-After. With retrieval.batch_window_ms set,
+concurrent turns' retrievals are embedded and scored together.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from contextlib import asynccontextmanager
+import yaml
+from contextmgr.multiuser import SessionManager
+from src.retrieval import ALL_NAMESPACES
+
+
+def _user_key(user_id: str, namespace: str | None = None) -> str:
+    """Session key of user_id in namespace; "/" and "%" are escaped so "team/alice" without one is not alice in team."""
+    def escape(part: str) -> str:
+        return part.replace("%", "%25").replace("/", "%2F")
+    return f"{escape(namespace)}/{escape(user_id)}" if namespace else escape(user_id)
+
+
+class Busy(Exception):
+    """Too many turns are waiting; the client should retry later."""
+
+
+class ContextServer:
+    """ASGI app over (app, seed, ds) from load_context_app."""
+    def __init__(self, app, seed, ds, sessions: SessionManager | None = None, max_turns: int = 64,
+                 max_queued_per_thread: int = 8, max_waiting: int = 1024):
+        self.app = app
+        self.seed = seed
+        self.ds = ds
+        self.sessions = sessions or SessionManager()
+        self.max_turns = max(1, max_turns)
+        self.max_queued_per_thread = max(1, max_queued_per_thread)
+        self.max_waiting = max(1, max_waiting)
+        self.waiting = 0
+        # user id -> [lock, turns queued or running]; asyncio.Lock wakes waiters in FIFO order
+        self._threads: dict[str, list] = {}
+        self._slots: asyncio.Semaphore | None = None
+
+    @asynccontextmanager
+    async def turn(self, user_id: str, namespace: str | None = None):
+        """Pinned, seeded thread id for one turn of user_id, in order behind that user's earlier turns."""
+        # the same user name in two namespaces is two users
+        user_id = _user_key(user_id, namespace)
+        entry = self._threads.setdefault(user_id, [asyncio.Lock(), 0])
+        if entry[1] >= self.max_queued_per_thread:
+            raise Busy(f"{entry[1]} turns already queued for {user_id}")
+        if self.waiting >= self.max_waiting:
+            raise Busy(f"{self.waiting} turns already waiting")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_turns)
+        entry[1] += 1
+        self.waiting += 1
+        started = False
+        try:
+            async with entry[0]:
+                async with self._slots:
+                    self.waiting -= 1
+                    started = True
+                    with self.sessions.session(user_id) as tid:
+                        await self._ensure_seeded(tid, namespace)
+                        yield tid
+        finally:
+            if not started:
+                self.waiting -= 1
+            entry[1] -= 1
+            if not entry[1]:
+                del self._threads[user_id]
+
+    async def _ensure_seeded(self, tid: str, namespace: str | None = None):
+        from src.runtime import aget_state
+        state = await aget_state(self.app, tid)
+        if not (state and state.values):
+            await asyncio.to_thread(self.seed, tid, namespace)
+
+    async def chat(self, user_id: str, message: str, namespace: str | None = None) -> tuple[str, str]:
+        from src.runtime import aget_state, asend_user_message
+        async with self.turn(user_id, namespace) as tid:
+            await asend_user_message(self.app, tid, message)
+            state = await aget_state(self.app, tid)
+        messages = (state.values or {}).get("messages") or []
+        return tid, str(getattr(messages[-1], "content", "")) if messages else ""
+
+    async def chat_stream(self, user_id: str, message: str, namespace: str | None = None):
+        from src.runtime import astream_user_message
+        async with self.turn(user_id, namespace) as tid:
+            async for token in astream_user_message(self.app, tid, message):
+                yield token
+
+    def stats(self) -> dict:
+        metrics = getattr(self.app, "metrics", None)
+        return {
+            "metrics": metrics.snapshot() if metrics is not None else None,
+            "sessions": self.sessions.stats(),
+            "server": {"waiting": self.waiting, "threads": len(self._threads), "max_turns": self.max_turns},
+        }
+
+    # -- ASGI --
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        method, path = scope["method"], scope["path"]
+        try:
+            if path == "/healthz" and method == "GET":
+                await _json(send, 200, {"ready": self.ds.ready})
+            elif path == "/v1/stats" and method == "GET":
+                await _json(send, 200, self.stats())
+            elif path == "/v1/reload" and method == "POST":
+                result = await asyncio.to_thread(self.app.reload)
+                await _json(send, 200, {"summary": result["report"].summary(), "errors": result["report"].errors,
+                                        "seed_changed": result["seed_changed"],
+                                        "restart_required": result["restart_required"]})
+            elif path == "/v1/chat" and method == "POST":
+                await self._chat(await _body(receive), send)
+            else:
+                await _json(send, 404, {"error": f"no route for {method} {path}"})
+        except Busy as e:
+            await _json(send, 429, {"error": str(e)}, [(b"retry-after", b"1")])
+
+    async def _chat(self, body: bytes, send):
+        try:
+            request = json.loads(body or b"{}")
+            user_id, message = str(request["user"]), str(request["message"])
+            namespace = str(request["namespace"]) if request.get("namespace") else None
+            if namespace == ALL_NAMESPACES:
+                # clients only ever see their own namespace and the shared chunks
+                raise ValueError(f"namespace {ALL_NAMESPACES!r} is not allowed")
+        except (ValueError, KeyError, TypeError) as e:
+            await _json(send, 400, {"error": f"expected JSON with user and message: {e}"})
+            return
+        if not request.get("stream"):
+            try:
+                tid, reply = await self.chat(user_id, message, namespace)
+            except Busy:
+                raise
+            except Exception as e:
+                await _json(send, 500, {"error": str(e)})
+                return
+            await _json(send, 200, {"thread_id": tid, "reply": reply})
+            return
+        stream = self.chat_stream(user_id, message, namespace)
+        try:
+            # the first token (or Busy) arrives before any header is sent
+            first = await anext(stream, None)
+        except Busy:
+            raise
+        except Exception as e:
+            await _json(send, 500, {"error": str(e)})
+            return
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-cache")]})
+        try:
+            if first is not None:
+                await _event(send, {"token": first})
+                async for token in stream:
+                    await _event(send, {"token": token})
+            await send({"type": "http.response.body", "body": b"event: done\ndata: {}\n\n", "more_body": False})
+        except Exception as e:
+            await send({"type": "http.response.body", "more_body": False,
+                        "body": f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n".encode("utf-8")})
+        finally:
+            await stream.aclose()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                checkpointer = getattr(self.app, "checkpointer", None)
+                if hasattr(checkpointer, "flush"):
+                    checkpointer.flush()
+                # a hung tool call must not hold the process open after shutdown
+                close = getattr(self.app, "close", None)
+                if close is not None:
+                    close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+async def _body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _json(send, status: int, payload, headers: list | None = None):
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json; charset=utf-8"), *(headers or [])]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _event(send, payload: dict):
+    data = f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+    await send({"type": "http.response.body", "body": data, "more_body": True})
+
+
+def build_server(config_path: str, tools=None, **kwargs) -> ContextServer:
+    """load_context_app(config_path, tools, **kwargs) behind a ContextServer configured by the YAML `server` block."""
+    from contextmgr.loader import load_context_app
+    with open(config_path, "r", encoding="utf-8") as f:
+        settings = (yaml.safe_load(f) or {}).get("server") or {}
+    app, seed, ds = load_context_app(config_path, tools=tools, **kwargs)
+    sessions = settings.get("sessions") or {}
+    manager = SessionManager(app, capacity=int(sessions.get("capacity", 0)), idle_ttl=float(sessions.get("idle_ttl", 0)),
+                             spill_dir=sessions.get("spill_dir"))
+    return ContextServer(app, seed, ds, manager,
+                         max_turns=int(settings.get("max_turns", 64)),
+                         max_queued_per_thread=int(settings.get("max_queued_per_thread", 8)),
+                         max_waiting=int(settings.get("max_waiting", 1024)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", default="configs/context.yaml")
+    parser.add_argument("--host", default=None, help="default server.host or 127.0.0.1")
+    parser.add_argument("--port", type=int, default=None, help="default server.port or 8765")
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        print("Error: the server needs uvicorn (pip install uvicorn)")
+        sys.exit(1)
+    from src.tools import strlen
+    with open(args.config, "r", encoding="utf-8") as f:
+        settings = (yaml.safe_load(f) or {}).get("server") or {}
+    server = build_server(args.config, tools=[strlen])
+    uvicorn.run(server, host=args.host or settings.get("host", "127.0.0.1"), port=args.port or int(settings.get("port", 8765)),
+                log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
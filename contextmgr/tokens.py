@@ -0,0 +1,23 @@
+import re
+
+# CJK ideographs, kana and full-width punctuation: roughly one token per character
+_WIDE = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast local token estimate: one per CJK character, one per ~4 characters of other text."""
+    wide = len(_WIDE.findall(text))
+    return wide + (len(text) - wide + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int, marker: str = "…") -> str:
+    """Cut text so that estimate_tokens(result) <= max_tokens, appending marker when anything was cut."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max(0, max_tokens - estimate_tokens(marker)) * 4
+    used = 0
+    for i, ch in enumerate(text):
+        used += 4 if _WIDE.match(ch) else 1
+        if used > budget:
+            return text[:i] + marker
+    return text
@@ -1,16 +1,119 @@
-from langchain_core.messages import ToolMessage
+import asyncio
+import inspect
+import queue
+import threading
+from concurrent.futures import Executor, Future
+
+def _tool_name(tool) -> str:
+    return getattr(tool, "name", None) or getattr(tool, "__name__", None) or str(tool)
+
+def tool_registry(tools) -> dict:
+    """name -> tool, built once; the first tool registered under a name wins."""
+    registry: dict = {}
+    for t in tools or []:
+        registry.setdefault(_tool_name(t), t)
+    return registry
+
+def _is_async_only(tool) -> bool:
+    # a LangChain tool built from a coroutine has no sync func
+    return getattr(tool, "coroutine", None) is not None and getattr(tool, "func", None) is None
 
 def _invoke_tool(tool, args):
     """
     Invoke a tool with given arguments.
-    Supports both LangChain tools and simple callables.
+    Supports both LangChain tools and simple callables; async tools are run to completion
+    on a private event loop (callers run this off the event loop, in a worker thread).
     """
     try:
         if hasattr(tool, "invoke"):
+            if _is_async_only(tool):
+                return asyncio.run(tool.ainvoke(args))
             return tool.invoke(args)
         elif callable(tool):
-            return tool(**args)
+            out = tool(**args)
+            return asyncio.run(out) if inspect.isawaitable(out) else out
+        else:
+            return f"Error: Tool {tool} is not callable"
+    except Exception as e:
+        return f"Error executing tool: {str(e)}"
+
+async def _ainvoke_tool(tool, args, executor=None):
+    """
+    Async counterpart of _invoke_tool: coroutine tools are awaited, sync ones run on executor
+    (the loop's default executor when None).
+    """
+    try:
+        if getattr(tool, "coroutine", None) is not None:
+            return await tool.ainvoke(args)
+        elif inspect.iscoroutinefunction(tool):
+            return await tool(**args)
+        elif hasattr(tool, "invoke") or callable(tool):
+            # a sync LangChain tool's own ainvoke would also use the default executor
+            return await asyncio.get_running_loop().run_in_executor(executor, _invoke_tool, tool, args)
         else:
             return f"Error: Tool {tool} is not callable"
     except Exception as e:
         return f"Error executing tool: {str(e)}"
+
+class ToolPool(Executor):
+    """
+    Bounded pool of daemon threads for sync tool calls, started on demand up to max_workers.
+    A timed-out call cannot be interrupted and keeps its thread; unlike ThreadPoolExecutor,
+    whose threads are joined at interpreter exit, such a thread does not keep the process alive.
+    """
+    def __init__(self, max_workers: int = 8, thread_name_prefix: str = "tool"):
+        self._max_workers = max(1, max_workers)
+        self._prefix = thread_name_prefix
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._idle = threading.Semaphore(0)
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._shutdown = False
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new tool calls after shutdown")
+            future: Future = Future()
+            self._queue.put((future, fn, args, kwargs))
+            if not self._idle.acquire(blocking=False) and len(self._threads) < self._max_workers:
+                t = threading.Thread(target=self._work, name=f"{self._prefix}_{len(self._threads)}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            return future
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            del item, future
+            self._idle.release()
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        """Stop the workers once they are free; queued calls are cancelled with cancel_futures."""
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        item[0].cancel()
+            for _ in self._threads:
+                self._queue.put(None)
+        if wait:
+            for t in self._threads:
+                t.join()
+
+def tool_error(call: dict, text: str):
+    from langchain_core.messages import ToolMessage
+    return ToolMessage(content=f"Error: {text}", tool_call_id=call.get("id") or "", name=call.get("name"), status="error")
@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+
+class QueueFull(Exception):
+    """Raised by RetrievalBatcher.retrieve(wait=False) when max_pending requests are already queued."""
+
+
+class RetrievalBatcher:
+    """
+    Gathers retrievals issued concurrently on one event loop (typically prepare_ctx of different
+    threads) and answers them with one DocStore.retrieve_batch call per window.
+    A batch closes window seconds after its first request or at max_batch requests; while a batch
+    is being searched the next one fills. At most max_pending requests wait: further callers wait
+    for room (or get QueueFull with wait=False), which gives the caller backpressure.
+    Requests are answered in groups of equal top_k and namespace.
+    """
+    def __init__(self, ds, window: float = 0.005, max_batch: int = 32, max_pending: int = 256, metrics=None):
+        self.ds = ds
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.max_pending = max(1, max_pending)
+        self.metrics = metrics
+        self.batches = 0
+        self.requests = 0
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._loop = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            # bound to the running loop; a new loop (e.g. asyncio.run per CLI turn) gets its own worker
+            self._loop = loop
+            self._queue = asyncio.Queue(self.max_pending)
+            self._worker = loop.create_task(self._run())
+
+    async def retrieve(self, query: str, top_k: int = 3, wait: bool = True, namespace: str | None = None):
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        item = (query, (top_k, namespace or None), future)
+        if wait:
+            await self._queue.put(item)
+        else:
+            try:
+                self._queue.put_nowait(item)
+            except asyncio.QueueFull:
+                raise QueueFull(f"{self.max_pending} retrievals already pending") from None
+        return await future
+
+    async def _run(self):
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._answer(batch)
+
+    async def _answer(self, batch: list):
+        self.batches += 1
+        self.requests += len(batch)
+        if self.metrics is not None:
+            self.metrics.observe("retrieval.batch_size", len(batch))
+        groups: dict[tuple, list] = {}
+        for item in batch:
+            groups.setdefault(item[1], []).append(item)
+        for (top_k, namespace), items in groups.items():
+            live = [item for item in items if not item[2].done()]
+            if not live:
+                continue
+            try:
+                # embedding and scoring leave the event loop free for the next window
+                results = await asyncio.to_thread(self.ds.retrieve_batch, [q for q, _, _ in live], top_k, namespace)
+            except Exception as e:
+                for _, _, future in live:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future), docs in zip(live, results):
+                if not future.done():
+                    future.set_result(docs)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch": self.requests / self.batches if self.batches else 0.0,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+        }
@@ -0,0 +1,113 @@
+import math
+import re
+import threading
+from array import array
+from collections import Counter
+import numpy as np
+
+# row sets at least 1/_FULL_PASS of the index are scored whole and then picked out
+_FULL_PASS = 16
+# Latin words/numbers, or runs of CJK ideographs
+_TOKEN = re.compile(r"[a-z0-9_]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercased Latin words plus CJK unigrams and bigrams.
+    Bigrams keep multi-character words ranked above scattered single characters
+    without needing a Chinese word segmenter.
+    """
+    tokens: list[str] = []
+    for m in _TOKEN.finditer(text.lower()):
+        word = m.group()
+        if word[0].isascii():
+            tokens.append(word)
+            continue
+        tokens.extend(word)
+        tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    Append-only inverted index with Okapi BM25 scoring.
+    Posting lists are compact typed arrays (row ids, term frequencies); each query
+    term is scored for all of its postings at once with NumPy.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._rows: dict[str, array] = {}
+        self._tfs: dict[str, array] = {}
+        self._doc_len = array("f")
+        # NumPy views of posting lists, rebuilt only for terms touched since the last query
+        self._compiled: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._dirty: set[str] = set()
+        self._norm = None
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def add(self, texts: list[str]):
+        """Index texts as the next rows (row ids continue from len(self))."""
+        with self._lock:
+            for text in texts:
+                row = len(self._doc_len)
+                counts = Counter(tokenize(text))
+                self._doc_len.append(sum(counts.values()))
+                for term, tf in counts.items():
+                    if term not in self._rows:
+                        self._rows[term] = array("i")
+                        self._tfs[term] = array("f")
+                    self._rows[term].append(row)
+                    self._tfs[term].append(tf)
+                    self._dirty.add(term)
+            self._norm = None
+
+    def _postings(self, term: str):
+        if term in self._dirty:
+            self._compiled[term] = (np.array(self._rows[term], dtype=np.int32), np.array(self._tfs[term], dtype=np.float32))
+            self._dirty.discard(term)
+        return self._compiled.get(term)
+
+    def scores(self, query: str, normalize: bool = False, rows=None) -> np.ndarray:
+        """
+        BM25 score of every row. With normalize=True scores are divided by the best
+        score any document could reach for this query, giving values in [0, 1).
+        With rows (sorted row ids) only postings of those rows are scored and the result is
+        aligned with rows; IDF and document lengths stay corpus-wide.
+        """
+        with self._lock:
+            n = len(self._doc_len)
+            picked = rows
+            if rows is not None and len(rows) * _FULL_PASS >= n:
+                rows = None
+            out = np.zeros(n if rows is None else len(rows), dtype=np.float32)
+            if not n or not len(out):
+                return out if picked is None else np.zeros(len(picked), dtype=np.float32)
+            if self._norm is None:
+                dl = np.array(self._doc_len, dtype=np.float32)
+                avgdl = float(dl.mean()) or 1.0
+                self._norm = self.k1 * (1.0 - self.b + self.b * dl / avgdl)
+            ceiling = 0.0
+            for term in set(tokenize(query)):
+                if term not in self._rows:
+                    continue
+                postings, tfs = self._postings(term)
+                idf = math.log(1.0 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                ceiling += idf * (self.k1 + 1.0)
+                target = postings
+                if rows is not None and len(rows) < len(postings):
+                    # probe the posting list for each of the few rows
+                    at = np.searchsorted(postings, rows)
+                    target = np.flatnonzero(postings[np.minimum(at, len(postings) - 1)] == rows)
+                    postings, tfs = rows[target], tfs[at[target]]
+                elif rows is not None:
+                    target = np.searchsorted(rows, postings)
+                    hit = rows[np.minimum(target, len(rows) - 1)] == postings
+                    target, postings, tfs = target[hit], postings[hit], tfs[hit]
+                out[target] += idf * tfs * (self.k1 + 1.0) / (tfs + self._norm[postings])
+        if normalize and ceiling > 0:
+            out /= ceiling
+        return out if picked is None or rows is not None else out[picked]
@@ -1,10 +1,32 @@
 from typing import TypedDict, Annotated, List, Any
-from langchain_core.messages import BaseMessage
+from langchain_core.messages import BaseMessage, RemoveMessage
 import operator
 
+# RemoveMessage id prefix meaning "drop the first n messages" (history folded into a summary)
+DROP_HEAD = "__drop_head__:"
+REMOVE_ALL = "__remove_all__"
+
+def drop_head(n: int) -> RemoveMessage:
+    return RemoveMessage(id=f"{DROP_HEAD}{n}")
+
 def merge_messages(left: list[BaseMessage], right: list[BaseMessage]) -> list[BaseMessage]:
-    """Append messages."""
-    return left + right
+    """
+    Append messages. RemoveMessage entries remove by id; drop_head(n) trims the oldest n
+    (history folded into history_summary), REMOVE_ALL clears.
+    The result is a new list: LangGraph can hand one list to several channel copies, so the
+    history must not be mutated in place. Pruning keeps that copy bounded.
+    """
+    merged = list(left or [])
+    for m in right:
+        if not isinstance(m, RemoveMessage):
+            merged.append(m)
+        elif m.id == REMOVE_ALL:
+            merged.clear()
+        elif m.id and m.id.startswith(DROP_HEAD):
+            del merged[:int(m.id[len(DROP_HEAD):])]
+        else:
+            merged = [x for x in merged if getattr(x, "id", None) != m.id]
+    return merged
 
 class ChatState(TypedDict):
     # Standard LangGraph message history
@@ -16,12 +38,27 @@ class ChatState(TypedDict):
     # Context buckets
     context_policies: List[str]
     context_facts: List[str]
+    # Retrieved chunks, by stable DocStore chunk id; resolved to text only when the prompt is rendered
+    context_fact_ids: List[str]
     context_instructions: List[str]
     context_examples: List[str]
     context_priority: List[str]
     
+    # Rolling summary of the messages that left the history window, and how many leading messages it covers
+    history_summary: str
+    history_summarized: int
+
+    # Tenant whose knowledge base retrieval searches besides the shared chunks; unset searches the shared chunks only
+    namespace: str
+
     # Legacy flat context support
     context: List[str]
+
+    # What the context token budget cut on the last LLM call (max_tokens, used, dropped, truncated)
+    context_trimmed: dict
+
+    # Static prompt prefix of the last LLM call: hash, estimated tokens, reused (memo hit), cached_tokens (provider)
+    prompt_prefix: dict
     
     # Procedure control
     procedure_enabled: bool
@@ -0,0 +1,396 @@
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Iterator, Sequence
+from src.metrics import timed_method, timer
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL, ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, parent_id TEXT,
+    type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB,
+    PRIMARY KEY (thread_id, ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL, ns TEXT NOT NULL, channel TEXT NOT NULL, version TEXT NOT NULL,
+    kind TEXT NOT NULL, base TEXT, depth INTEGER NOT NULL DEFAULT 0, type TEXT, value BLOB,
+    PRIMARY KEY (thread_id, ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL, ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL, channel TEXT NOT NULL, type TEXT, value BLOB, task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, ns, checkpoint_id, task_id, idx)
+);
+"""
+
+# blob kinds: a full value, an empty channel, or list items appended to the value at `base`
+_FULL, _EMPTY, _APPEND = "full", "empty", "append"
+
+
+def _is_prefix(prev: list, value: list) -> bool:
+    # reducers build a new list from the old items, so an identity check is enough and O(n) pointer compares
+    return len(prev) <= len(value) and all(a is b for a, b in zip(prev, value))
+
+
+class SQLiteDeltaSaver(BaseCheckpointSaver[str]):
+    """
+    LangGraph checkpointer on a local SQLite file that stores deltas.
+    Only channels whose version changed are written; a list channel that grew by appending
+    (messages, fact ids) stores just the new items on top of its previous version, with a full
+    copy every max_chain steps so a load never replays long chains. Writes are grouped into one
+    transaction per `batch` operations or `interval` seconds; compact() folds old history away.
+    WAL mode lets several worker processes share the file.
+    """
+    def __init__(self, path: str, batch: int = 16, interval: float = 1.0, max_chain: int = 64, serde=None):
+        super().__init__(serde=serde)
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.batch = max(1, batch)
+        self.interval = interval
+        self.max_chain = max(1, max_chain)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._pending = 0
+        self._timer: threading.Timer | None = None
+        # (thread, ns, channel) -> (version, value, depth) of the last value written or read
+        self._last: dict[tuple[str, str, str], tuple[str, Any, int]] = {}
+        # optional src.metrics.Metrics; load_context_app attaches the app's
+        self.metrics = None
+
+    # -- transactions --
+
+    def _begin(self):
+        # caller holds the lock
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN")
+
+    def _wrote(self):
+        self._pending += 1
+        if self._pending >= self.batch or self.interval <= 0:
+            self._commit()
+        elif self._timer is None:
+            # a quiet thread still reaches disk within `interval`
+            self._timer = threading.Timer(self.interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _commit(self):
+        if self._conn.in_transaction:
+            with timer(self.metrics, "checkpoint.commit"):
+                self._conn.execute("COMMIT")
+        self._pending = 0
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def flush(self):
+        """Commit buffered checkpoint writes."""
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
+
+    # -- blobs --
+
+    def _put_blob(self, thread_id: str, ns: str, channel: str, version: str, value: Any, present: bool):
+        key = (thread_id, ns, channel)
+        if not present:
+            self._last.pop(key, None)
+            row = (thread_id, ns, channel, version, _EMPTY, None, 0, None, None)
+        else:
+            last = self._last.get(key)
+            if (isinstance(value, list) and last is not None and isinstance(last[1], list)
+                    and last[2] < self.max_chain and _is_prefix(last[1], value)):
+                kind, base, depth = _APPEND, last[0], last[2] + 1
+                type_, blob = self.serde.dumps_typed(value[len(last[1]):])
+            else:
+                kind, base, depth = _FULL, None, 0
+                type_, blob = self.serde.dumps_typed(value)
+            self._last[key] = (version, value, depth)
+            row = (thread_id, ns, channel, version, kind, base, depth, type_, blob)
+        self._conn.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+
+    def _load_blob(self, thread_id: str, ns: str, channel: str, version: str):
+        """(present, value) of one channel version, replaying appended items onto the nearest full copy."""
+        key = (thread_id, ns, channel)
+        last = self._last.get(key)
+        if last is not None and last[0] == version:
+            return True, list(last[1]) if isinstance(last[1], list) else last[1]
+        tails: list = []
+        depth, current = 0, version
+        while True:
+            row = self._conn.execute(
+                "SELECT kind, base, depth, type, value FROM blobs WHERE thread_id=? AND ns=? AND channel=? AND version=?",
+                (thread_id, ns, channel, current),
+            ).fetchone()
+            if row is None:
+                return False, None
+            kind, base, row_depth, type_, blob = row
+            if current == version:
+                depth = row_depth
+            if kind == _EMPTY:
+                return False, None
+            tails.append(self.serde.loads_typed((type_, blob)))
+            if kind == _FULL:
+                break
+            current = base
+        value = tails.pop()
+        if tails:
+            value = list(value)
+            for tail in reversed(tails):
+                value.extend(tail)
+        self._last[key] = (version, value, depth)
+        return True, list(value) if isinstance(value, list) else value
+
+    def _channel_values(self, thread_id: str, ns: str, versions: ChannelVersions) -> dict[str, Any]:
+        values: dict[str, Any] = {}
+        for channel, version in versions.items():
+            present, value = self._load_blob(thread_id, ns, channel, str(version))
+            if present:
+                values[channel] = value
+        return values
+
+    def _tuple(self, thread_id: str, ns: str, row) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, blob, meta_type, metadata = row
+        checkpoint: Checkpoint = self.serde.loads_typed((type_, blob))
+        writes = self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id=? AND ns=? AND checkpoint_id=? "
+            "ORDER BY task_path, task_id, idx",
+            (thread_id, ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={**checkpoint, "channel_values": self._channel_values(thread_id, ns, checkpoint["channel_versions"])},
+            metadata=self.serde.loads_typed((meta_type, metadata)) if metadata is not None else {},
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    # -- BaseCheckpointSaver --
+
+    @timed_method("checkpoint.get")
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id = str(config["configurable"]["thread_id"])
+        ns = config["configurable"].get("checkpoint_ns", "")
+        sql = "SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints WHERE thread_id=? AND ns=?"
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self._conn.execute(sql + " AND checkpoint_id=?", (thread_id, ns, checkpoint_id)).fetchone()
+            else:
+                row = self._conn.execute(sql + " ORDER BY checkpoint_id DESC LIMIT 1", (thread_id, ns)).fetchone()
+            return self._tuple(thread_id, ns, row) if row else None
+
+    def list(self, config: RunnableConfig | None, *, filter: dict[str, Any] | None = None,
+             before: RunnableConfig | None = None, limit: int | None = None) -> Iterator[CheckpointTuple]:
+        where, args = [], []
+        if config:
+            where.append("thread_id=?")
+            args.append(str(config["configurable"]["thread_id"]))
+            if (ns := config["configurable"].get("checkpoint_ns")) is not None:
+                where.append("ns=?")
+                args.append(ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id=?")
+                args.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id<?")
+            args.append(before_id)
+        sql = "SELECT thread_id, ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY checkpoint_id DESC"
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        for thread_id, ns, *row in rows:
+            if limit is not None and limit <= 0:
+                break
+            with self._lock:
+                item = self._tuple(thread_id, ns, row)
+            if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield item
+
+    @timed_method("checkpoint.put")
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = str(config["configurable"]["thread_id"])
+        ns = config["configurable"].get("checkpoint_ns", "")
+        saved = checkpoint.copy()
+        values = saved.pop("channel_values")
+        type_, blob = self.serde.dumps_typed(saved)
+        meta_type, meta = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            self._begin()
+            for channel, version in new_versions.items():
+                self._put_blob(thread_id, ns, channel, str(version), values.get(channel), channel in values)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, ns, checkpoint["id"], config["configurable"].get("checkpoint_id"), type_, blob, meta_type, meta),
+            )
+            self._wrote()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint["id"]}}
+
+    @timed_method("checkpoint.put_writes")
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = str(config["configurable"]["thread_id"])
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            rows.append((thread_id, ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, type_, blob, task_path))
+        with self._lock:
+            self._begin()
+            # special writes (errors, interrupts) may be replaced; regular ones are written once
+            self._conn.executemany("INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   [r for r in rows if r[4] >= 0])
+            self._conn.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   [r for r in rows if r[4] < 0])
+            self._wrote()
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._begin()
+            for table in ("checkpoints", "blobs", "writes"):
+                self._conn.execute(f"DELETE FROM {table} WHERE thread_id=?", (str(thread_id),))
+            self._commit()
+            self._forget(str(thread_id))
+
+    def evict(self, thread_id: str) -> None:
+        """Drop the cached channel values of a thread; its checkpoints stay on disk."""
+        with self._lock:
+            self._commit()
+            self._forget(str(thread_id))
+
+    def _forget(self, thread_id: str):
+        for key in [k for k in self._last if k[0] == thread_id]:
+            del self._last[key]
+
+    def prune(self, thread_ids: Sequence[str], *, strategy: str = "keep_latest") -> None:
+        if strategy == "delete":
+            for thread_id in thread_ids:
+                self.delete_thread(thread_id)
+        elif strategy == "keep_latest":
+            self.compact(keep_last=1, thread_ids=thread_ids)
+        else:
+            raise ValueError(f"unknown prune strategy: {strategy}")
+
+    def get_next_version(self, current: str | None, channel: None = None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # -- compaction --
+
+    def compact(self, keep_last: int = 20, thread_ids: Sequence[str] | None = None, vacuum: bool = False) -> dict:
+        """
+        Keep the newest keep_last checkpoints per thread/namespace, rewrite the channel values they
+        reference as full copies, and drop everything else. Run it when no other process is writing
+        the same threads, e.g. at startup.
+        """
+        keep_last = max(1, keep_last)
+        started = time.perf_counter()
+        with self._lock:
+            self._commit()
+            if thread_ids is None:
+                threads = [r[0] for r in self._conn.execute("SELECT DISTINCT thread_id FROM checkpoints")]
+            else:
+                threads = [str(t) for t in thread_ids]
+            dropped = 0
+            self._begin()
+            for thread_id in threads:
+                for (ns,) in self._conn.execute("SELECT DISTINCT ns FROM checkpoints WHERE thread_id=?", (thread_id,)).fetchall():
+                    dropped += self._compact_ns(thread_id, ns, keep_last)
+            self._last.clear()
+            self._commit()
+            if vacuum:
+                self._conn.execute("VACUUM")
+        return {"threads": len(threads), "dropped": dropped, "seconds": time.perf_counter() - started}
+
+    def _compact_ns(self, thread_id: str, ns: str, keep_last: int) -> int:
+        rows = self._conn.execute(
+            "SELECT checkpoint_id, type, checkpoint FROM checkpoints WHERE thread_id=? AND ns=? ORDER BY checkpoint_id DESC",
+            (thread_id, ns),
+        ).fetchall()
+        kept, old = rows[:keep_last], [r[0] for r in rows[keep_last:]]
+        live: set[tuple[str, str]] = set()
+        for _, type_, blob in kept:
+            live.update((c, str(v)) for c, v in self.serde.loads_typed((type_, blob))["channel_versions"].items())
+        # materialize every live value first, so deleting its bases cannot break a chain
+        full = {}
+        for channel, version in live:
+            present, value = self._load_blob(thread_id, ns, channel, version)
+            if present:
+                full[(channel, version)] = self.serde.dumps_typed(value)
+        self._conn.executemany(
+            "UPDATE blobs SET kind=?, base=NULL, depth=0, type=?, value=? WHERE thread_id=? AND ns=? AND channel=? AND version=?",
+            [(_FULL, t, b, thread_id, ns, c, v) for (c, v), (t, b) in full.items()],
+        )
+        stored = self._conn.execute("SELECT channel, version FROM blobs WHERE thread_id=? AND ns=?", (thread_id, ns)).fetchall()
+        self._conn.executemany(
+            "DELETE FROM blobs WHERE thread_id=? AND ns=? AND channel=? AND version=?",
+            [(thread_id, ns, c, v) for c, v in stored if (c, v) not in live],
+        )
+        for checkpoint_id in old:
+            self._conn.execute("DELETE FROM checkpoints WHERE thread_id=? AND ns=? AND checkpoint_id=?", (thread_id, ns, checkpoint_id))
+            self._conn.execute("DELETE FROM writes WHERE thread_id=? AND ns=? AND checkpoint_id=?", (thread_id, ns, checkpoint_id))
+        if old:
+            # the oldest kept checkpoint becomes the root of the thread's history
+            self._conn.execute("UPDATE checkpoints SET parent_id=NULL WHERE thread_id=? AND ns=? AND parent_id IN (%s)"
+                               % ",".join("?" * len(old)), (thread_id, ns, *old))
+        return len(old)
+
+    # -- async --
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: RunnableConfig | None, *, filter: dict[str, Any] | None = None,
+                    before: RunnableConfig | None = None, limit: int | None = None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    async def aprune(self, thread_ids: Sequence[str], *, strategy: str = "keep_latest") -> None:
+        await asyncio.to_thread(self.prune, thread_ids, strategy=strategy)
@@ -0,0 +1,96 @@
+import hashlib
+import numpy as np
+from src.bm25 import _TOKEN, tokenize
+
+_BITS = np.arange(64, dtype=np.uint64)
+
+
+def _features(text: str, shingle: int) -> list[str]:
+    tokens = tokenize(text)
+    lowered = text.lower()
+    covered = sum(len(m.group()) for m in _TOKEN.finditer(lowered))
+    chars = "".join(lowered.split())
+    if tokens and 2 * covered >= len(chars):
+        return [" ".join(tokens[i:i + shingle]) for i in range(max(1, len(tokens) - shingle + 1))]
+    # mostly text the tokenizer skips (Cyrillic, Hangul, kana, symbols): character n-grams instead
+    n = shingle + 1
+    return [chars[i:i + n] for i in range(max(1, len(chars) - n + 1))] if chars else []
+
+
+def shingles(text: str, shingle: int = 3) -> set[str]:
+    """
+    Shingles of the tokens BM25 uses (Latin words, CJK uni/bigrams), or character n-grams when
+    those tokens cover less than half of the text. Empty only for whitespace-only text.
+    """
+    return set(_features(text, shingle))
+
+
+def fingerprint(features: set[str]) -> int:
+    """
+    64-bit SimHash of a shingle set. Every distinct shingle counts once, so boilerplate repeated
+    throughout a text does not outweigh its content. Shingles keep word order in the fingerprint,
+    so texts that merely share a vocabulary stay apart.
+    """
+    if not features:
+        return 0
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "little") for t in features),
+        dtype=np.uint64, count=len(features),
+    )
+    bits = ((hashes[:, None] >> _BITS) & np.uint64(1)).astype(np.float64)
+    acc = (2.0 * bits - 1.0).sum(axis=0)
+    return int(np.packbits((acc > 0)[::-1]).view(">u8")[0])
+
+
+def simhash(text: str, shingle: int = 3) -> int:
+    """fingerprint() of the text's shingles; only whitespace-only text hashes to 0."""
+    return fingerprint(shingles(text, shingle))
+
+
+def resemblance(a: set[str], b: set[str]) -> float:
+    """Jaccard similarity of two shingle sets, to confirm that a SimHash match is a near duplicate."""
+    if not a or not b:
+        return float(a == b)
+    return len(a & b) / len(a | b)
+
+
+class SimHashIndex:
+    """
+    Finds a stored fingerprint within max_distance Hamming bits of a query.
+    Fingerprints are split into max_distance + 1 bands; by pigeonhole any near duplicate
+    shares at least one band exactly, so only rows in matching buckets are compared.
+    """
+    def __init__(self, max_distance: int = 3):
+        self.max_distance = max_distance
+        self._bands = min(max_distance + 1, 16)
+        self._width = 64 // self._bands
+        self._buckets: list[dict[int, list[int]]] = [{} for _ in range(self._bands)]
+        self._hashes: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def _keys(self, h: int):
+        mask = (1 << self._width) - 1
+        return [(h >> (i * self._width)) & mask for i in range(self._bands)]
+
+    def candidates(self, h: int):
+        """Ids of stored fingerprints within max_distance bits of h, each once."""
+        seen: set[int] = set()
+        for band, key in zip(self._buckets, self._keys(h)):
+            for row in band.get(key, ()):
+                if row not in seen and (self._hashes[row] ^ h).bit_count() <= self.max_distance:
+                    seen.add(row)
+                    yield row
+
+    def find(self, h: int) -> int | None:
+        """Return the id of a stored near duplicate of h, or None."""
+        return next(self.candidates(h), None)
+
+    def add(self, h: int) -> int:
+        """Store h under the next id (ids continue from len(self))."""
+        row = len(self._hashes)
+        self._hashes.append(h)
+        for band, key in zip(self._buckets, self._keys(h)):
+            band.setdefault(key, []).append(row)
+        return row
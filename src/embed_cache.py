@@ -0,0 +1,56 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache backed by a local SQLite file.
+    Keys are content hashes of (embedding model, chunk text), so unchanged chunks
+    are never re-embedded across restarts.
+    """
+    # Stay well below SQLite's host-parameter limit for IN (...) lookups
+    _BATCH = 500
+
+    def __init__(self, path: str):
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB NOT NULL)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(text: str, model: str = "") -> str:
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        found: dict[str, list[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(unique), self._BATCH):
+                batch = unique[i:i + self._BATCH]
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", batch)
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, items: dict[str, list[float]]):
+        if not items:
+            return
+        rows = [(k, array("f", v).tobytes()) for k, v in items.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
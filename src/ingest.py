@@ -0,0 +1,192 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, fields
+from typing import Callable, Iterator, NamedTuple
+
+# progress(stage, done, total) with stage in {"read", "embed", "index"}
+Progress = Callable[[str, int, int], None]
+
+# metadata SimpleDirectoryReader keeps out of the embedding and LLM views of a chunk
+_EXCLUDED_METADATA = ["file_name", "file_type", "file_size", "creation_date", "last_modified_date", "last_accessed_date"]
+
+
+class Chunk(NamedTuple):
+    text: str
+    embed_text: str
+    metadata: dict
+
+
+@dataclass
+class IngestReport:
+    files: int = 0
+    chunks: int = 0
+    embedded: int = 0
+    cached: int = 0
+    duplicates: int = 0
+    errors: dict[str, str] = field(default_factory=dict)
+    seconds: float = 0.0
+    # incremental refresh only: files left as they were / dropped from the index
+    unchanged: int = 0
+    removed: int = 0
+
+    def merge(self, other: "IngestReport"):
+        """Add another run's counts, time and errors (e.g. one per namespace) to this report."""
+        for f in fields(self):
+            if f.name == "errors":
+                self.errors.update(other.errors)
+            else:
+                setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+
+    def summary(self) -> str:
+        text = f"{self.files} files, {self.chunks} chunks ({self.embedded} embedded, {self.cached} cached) in {self.seconds:.1f}s"
+        if self.duplicates:
+            text += f", {self.duplicates} near-duplicates merged"
+        if self.unchanged or self.removed:
+            text += f", {self.unchanged} unchanged, {self.removed} removed"
+        if self.errors:
+            text += f", {len(self.errors)} failed"
+        return text
+
+
+def file_fingerprint(path: str, known: dict | None = None) -> dict:
+    """Manifest entry {mtime, size, sha1}; the content is only hashed when mtime or size differ from known."""
+    st = os.stat(path)
+    if known and known.get("mtime") == st.st_mtime and known.get("size") == st.st_size:
+        return known
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return {"mtime": st.st_mtime, "size": st.st_size, "sha1": digest.hexdigest()}
+
+
+def expand_sources(files: list[str], dirs: list[str], errors: dict[str, str]) -> list[str]:
+    """Resolve doc_files/doc_dirs into a de-duplicated file list; unreadable directories land in errors."""
+    paths = [str(p) for p in files]
+    for d in dirs:
+        try:
+            from llama_index.core import SimpleDirectoryReader
+            paths.extend(str(p) for p in SimpleDirectoryReader(input_dir=str(d), recursive=True).input_files)
+        except Exception as e:
+            errors[str(d)] = str(e)
+    return list(dict.fromkeys(paths))
+
+
+def read_and_chunk(path: str, chunk_size: int = 1024, chunk_overlap: int = 200) -> list[Chunk]:
+    """Read one file and split it into chunks. Runs inside pool workers, so it only returns plain data."""
+    from llama_index.core import SimpleDirectoryReader
+    from llama_index.core.node_parser import SentenceSplitter
+    from llama_index.core.schema import MetadataMode
+    docs = SimpleDirectoryReader(input_files=[path]).load_data()
+    nodes = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap).get_nodes_from_documents(docs)
+    return [Chunk(n.get_content(), n.get_content(metadata_mode=MetadataMode.EMBED), dict(n.metadata or {})) for n in nodes]
+
+
+def iter_file_chunks(path: str, chunk_size: int = 1024, chunk_overlap: int = 200,
+                     block_chars: int = 1 << 20) -> Iterator[Chunk]:
+    """
+    Yield the chunks of one file. Plain-text files larger than block_chars are read and split
+    one block at a time (cut at line ends), so a multi-GB log is never held in memory whole;
+    formats with a dedicated reader (pdf, docx, ...) go through SimpleDirectoryReader.
+    """
+    from llama_index.core import Document, SimpleDirectoryReader
+    from llama_index.core.node_parser import SentenceSplitter
+    from llama_index.core.readers.file.base import default_file_metadata_func
+    from llama_index.core.schema import MetadataMode
+    suffix = os.path.splitext(path)[1].lower()
+    if os.path.getsize(path) <= block_chars or suffix in SimpleDirectoryReader.supported_suffix_fn():
+        yield from read_and_chunk(path, chunk_size, chunk_overlap)
+        return
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    metadata = default_file_metadata_func(path)
+
+    def split(text: str):
+        doc = Document(text=text, metadata=dict(metadata))
+        doc.excluded_embed_metadata_keys = list(_EXCLUDED_METADATA)
+        doc.excluded_llm_metadata_keys = list(_EXCLUDED_METADATA)
+        for n in splitter.get_nodes_from_documents([doc]):
+            yield Chunk(n.get_content(), n.get_content(metadata_mode=MetadataMode.EMBED), dict(n.metadata or {}))
+
+    carry = ""
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        while block := f.read(block_chars):
+            text = carry + block
+            cut = text.rfind("\n") + 1 or len(text)
+            carry = text[cut:]
+            yield from split(text[:cut])
+    if carry.strip():
+        yield from split(carry)
+
+
+def iter_chunks(paths: list[str], chunk_size: int, chunk_overlap: int, errors: dict[str, str],
+                progress: Progress | None = None) -> Iterator[tuple[int, Chunk]]:
+    """Lazily yield (path index, chunk) for every file; a failing file lands in errors and the stream moves on."""
+    for i, path in enumerate(paths):
+        try:
+            for chunk in iter_file_chunks(path, chunk_size, chunk_overlap):
+                yield i, chunk
+        except Exception as e:
+            errors[path] = str(e)
+        if progress:
+            progress("read", i + 1, len(paths))
+
+
+def chunk_files(paths: list[str], workers: int, chunk_size: int, chunk_overlap: int,
+                errors: dict[str, str], progress: Progress | None = None) -> list[list[Chunk]]:
+    """
+    Stage 1: read and chunk files on a process pool.
+    Returns one chunk list per path, in input order; failed files yield [] and an errors entry.
+    """
+    out: list[list[Chunk]] = [[] for _ in paths]
+    if workers <= 1 or len(paths) <= 1:
+        for i, path in enumerate(paths):
+            try:
+                out[i] = read_and_chunk(path, chunk_size, chunk_overlap)
+            except Exception as e:
+                errors[path] = str(e)
+            if progress:
+                progress("read", i + 1, len(paths))
+        return out
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+        futures = {pool.submit(read_and_chunk, path, chunk_size, chunk_overlap): i for i, path in enumerate(paths)}
+        for done, fut in enumerate(as_completed(futures), 1):
+            i = futures[fut]
+            try:
+                out[i] = fut.result()
+            except Exception as e:
+                errors[paths[i]] = str(e)
+            if progress:
+                progress("read", done, len(paths))
+    return out
+
+
+def embed_batches(texts: list[str], embed: Callable[[list[str]], list[list[float]]], batch_size: int,
+                  concurrency: int, progress: Progress | None = None) -> tuple[list, dict[int, str]]:
+    """
+    Stage 2: embed texts in batches with at most `concurrency` requests in flight.
+    Returns (vectors aligned with texts, {batch start: error}); vectors of failed batches are None.
+    """
+    batch_size = max(1, batch_size)
+    vectors: list = [None] * len(texts)
+    failed: dict[int, str] = {}
+    starts = list(range(0, len(texts), batch_size))
+    if not starts:
+        return vectors, failed
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {pool.submit(embed, texts[s:s + batch_size]): s for s in starts}
+        done = 0
+        for fut in as_completed(futures):
+            s = futures[fut]
+            try:
+                vectors[s:s + batch_size] = fut.result()
+            except Exception as e:
+                failed[s] = str(e)
+            done += min(batch_size, len(texts) - s)
+            if progress:
+                progress("embed", done, len(texts))
+    return vectors, failed
+
+
+def default_workers() -> int:
+    return max(1, min(8, (os.cpu_count() or 2) - 1))
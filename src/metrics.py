@@ -0,0 +1,259 @@
+import functools
+import inspect
+import io
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable
+
+
+class Histogram:
+    """
+    Counts on a log scale (each bucket about 19% wider than the previous), so memory stays constant
+    and percentiles are accurate to within one bucket.
+    """
+    _GROWTH = 2 ** 0.25
+
+    def __init__(self, unit: str = ""):
+        self.unit = unit
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buckets: dict[int, int] = {}
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        index = math.floor(math.log(value, self._GROWTH)) if value > 0 else -10**6
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                # bucket upper bound, clamped to what was actually observed
+                upper = self._GROWTH ** (index + 1) if index > -10**6 else 0.0
+                return min(max(upper, self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        if not self.count:
+            return {"count": 0, "unit": self.unit}
+        return {
+            "count": self.count,
+            "unit": self.unit,
+            "mean": self.total / self.count,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "min": self.min,
+            "max": self.max,
+        }
+
+
+def timer(metrics: "Metrics | None", name: str):
+    """metrics.timer(name), or a no-op when instrumentation is off."""
+    return metrics.timer(name) if metrics is not None else nullcontext()
+
+
+def timed_method(name: str):
+    """Decorator timing a (sync or async) method under name when its instance has a Metrics in self.metrics."""
+    def wrap(method):
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def atimed(self, *args, **kwargs):
+                with timer(self.metrics, name):
+                    return await method(self, *args, **kwargs)
+            return atimed
+
+        @functools.wraps(method)
+        def timed(self, *args, **kwargs):
+            with timer(self.metrics, name):
+                return method(self, *args, **kwargs)
+        return timed
+    return wrap
+
+
+class Metrics:
+    """
+    Process-wide instrumentation: latency/size histograms, counters, and named sources
+    (callables returning dicts, e.g. cache stats) that are read when a snapshot is taken.
+
+    Exporters are called as exporter(name, value, unit) for every observation and
+    exporter(name, n, "count") for every counter increment; one that raises is removed.
+
+    With profile_sample > 0 a random share of profile() blocks (one per turn) run under cProfile;
+    profile_next() forces the next one. The top functions of the last few profiles are kept
+    in memory and, with profile_dir, the full stats are written there as .prof files.
+    cProfile sees only the calling thread and allows one profile at a time per process,
+    so overlapping turns are not profiled.
+    """
+    def __init__(self, profile_sample: float = 0.0, profile_dir: str | None = None, profile_top: int = 15,
+                 keep_profiles: int = 5):
+        self.profile_sample = profile_sample
+        self.profile_dir = profile_dir
+        self.profile_top = profile_top
+        self.profiles: deque[dict] = deque(maxlen=keep_profiles)
+        self._lock = threading.Lock()
+        self._histograms: dict[str, Histogram] = {}
+        self._counters: dict[str, int] = {}
+        self._sources: dict[str, Callable[[], dict]] = {}
+        self._exporters: list[Callable[[str, float, str], Any]] = []
+        self._profiling = False
+        self._profile_next = False
+
+    # -- recording --
+
+    def observe(self, name: str, value: float, unit: str = ""):
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = Histogram(unit)
+            hist.add(value)
+        self._export(name, value, unit)
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+        self._export(name, n, "count")
+
+    @contextmanager
+    def timer(self, name: str):
+        """Record the block's wall time in milliseconds, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - started) * 1000, "ms")
+
+    def timed(self, name: str, fn: Callable) -> Callable:
+        """Wrap a sync or async function so every call is timed under name."""
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def atimed(*args, **kwargs):
+                with self.timer(name):
+                    return await fn(*args, **kwargs)
+            return atimed
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            with self.timer(name):
+                return fn(*args, **kwargs)
+        return timed
+
+    def add_source(self, name: str, source: Callable[[], dict]):
+        self._sources[name] = source
+
+    def add_exporter(self, exporter: Callable[[str, float, str], Any]):
+        self._exporters.append(exporter)
+
+    def _export(self, name: str, value: float, unit: str):
+        for exporter in list(self._exporters):
+            try:
+                exporter(name, value, unit)
+            except Exception as e:
+                print(f"Warning: metrics exporter {exporter!r} failed and was removed: {e}")
+                if exporter in self._exporters:
+                    self._exporters.remove(exporter)
+
+    # -- reading --
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = {name: h.summary() for name, h in self._histograms.items()}
+            counters = dict(self._counters)
+        sources = {}
+        for name, source in list(self._sources.items()):
+            try:
+                sources[name] = source()
+            except Exception as e:
+                sources[name] = {"error": str(e)}
+        return {"histograms": histograms, "counters": counters, "sources": sources, "profiles": list(self.profiles)}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.profiles.clear()
+
+    def report(self) -> str:
+        """Human-readable snapshot: one line per histogram, counter and source."""
+        snap = self.snapshot()
+        lines = []
+        if snap["histograms"]:
+            lines.append(f"{'metric':<28}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+            for name, s in sorted(snap["histograms"].items()):
+                if not s["count"]:
+                    continue
+                unit = f" {s['unit']}" if s["unit"] else ""
+                lines.append(f"{name + unit:<28}{s['count']:>7}" + "".join(
+                    f"{s[k]:>10.1f}" for k in ("mean", "p50", "p95", "p99", "max")))
+        for name, n in sorted(snap["counters"].items()):
+            lines.append(f"{name:<28}{n:>7}")
+        for name, values in sorted(snap["sources"].items()):
+            shown = ", ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in values.items())
+            lines.append(f"{name}: {shown}")
+        for p in snap["profiles"]:
+            lines.append(f"profile {p['label']} ({p['ms']:.1f} ms){' -> ' + p['file'] if p.get('file') else ''}")
+            lines.extend(f"  {cum:9.1f} ms  {func}" for func, cum in p["top"])
+        return "\n".join(lines) if lines else "No metrics recorded yet."
+
+    # -- profiling --
+
+    def profile_next(self):
+        """Profile the next profile() block regardless of profile_sample."""
+        self._profile_next = True
+
+    @contextmanager
+    def profile(self, label: str):
+        with self._lock:
+            wanted = self._profile_next or (self.profile_sample > 0 and random.random() < self.profile_sample)
+            start = wanted and not self._profiling
+            if start:
+                self._profiling = True
+                self._profile_next = False
+        if not start:
+            yield
+            return
+        import cProfile
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler (or debugger) is active
+            with self._lock:
+                self._profiling = False
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._lock:
+                self._profiling = False
+            self._keep_profile(profiler, label, (time.perf_counter() - started) * 1000)
+
+    def _keep_profile(self, profiler, label: str, ms: float):
+        import pstats
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.profile_top]
+        top = [(f"{os.path.basename(f)}:{line}({func})", cum * 1000) for (f, line, func), (_, _, _, cum, _) in rows]
+        entry = {"label": label, "ms": ms, "top": top}
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in label)
+            entry["file"] = os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe}.prof")
+            stats.dump_stats(entry["file"])
+        self.profiles.append(entry)
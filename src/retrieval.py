@@ -1,3 +1,14 @@
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from array import array
+from src.metrics import timed_method, timer
+from src.query_cache import QueryCache, normalize_query
+
 
 class SimpleDocument:
     """
@@ -13,27 +24,189 @@ class SimpleDocument:
     def __repr__(self):
         return f"SimpleDocument(content={self.page_content[:20]}..., metadata={self.metadata})"
 
+
+# model name of a store built in bm25 mode, whose vectors are placeholders
+_LEXICAL_ONLY = "lexical-only"
+# shingle Jaccard a SimHash match must reach to be collapsed as a near duplicate
+_NEAR_DUP_RESEMBLANCE = 0.8
+# file manifest kept next to the vector snapshot
+_MANIFEST = "manifest.json"
+# retrieve(..., namespace=ALL_NAMESPACES) searches every tenant's chunks; not a valid namespace to ingest into
+ALL_NAMESPACES = "*"
+
+
+def chunk_id(source: str, text: str, namespace: str | None = None) -> str:
+    """Stable chunk identifier derived from its origin and content (and namespace, when it has one)."""
+    key = f"{namespace}\x00{source}\x00{text}" if namespace else f"{source}\x00{text}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def source_of(metadata: dict) -> str:
+    # LlamaIndex SimpleDirectoryReader puts file path in 'file_path' key by default
+    return metadata.get("file_path") or metadata.get("file_name") or "unknown"
+
+
+def _merge_source(metadata: dict, source: str) -> bool:
+    """Record an extra origin in metadata["sources"]; returns False if it was already listed."""
+    sources = metadata.setdefault("sources", [source_of(metadata)])
+    if source in sources:
+        return False
+    metadata["sources"] = sources + [source]
+    return True
+
+
+def _tagged(fingerprint: dict, namespace: str | None) -> dict:
+    """Manifest entry carrying the file's namespace (none for shared files)."""
+    entry = {k: v for k, v in fingerprint.items() if k != "namespace"}
+    if namespace:
+        entry["namespace"] = namespace
+    return entry
+
+
+class _Index:
+    """
+    One generation of the searchable index: a VectorStore and the structures derived from its rows
+    (BM25, SimHash, chunk id and namespace row maps, caught up lazily as rows are appended).
+    BM25 and SimHash are built under their own locks, so a first build after startup or a refresh
+    holds up only the searches (or ingests) that need it, not DocStore._lock.
+    refresh() and load_snapshot() replace the whole object, never its parts, so a search that took
+    the object at its start scores, ranks and reads texts from one consistent store.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.bm25 = None
+        self.bm25_lock = threading.Lock()
+        self.simhashes = None
+        self.simhash_lock = threading.Lock()
+        # chunk id -> row, filled lazily up to row id_rows_upto
+        self.id_rows: dict[str, int] = {}
+        self.id_rows_upto = 0
+        # namespace ("" for shared) -> its rows, appended up to row ns_rows_upto; compiled to sorted arrays on use
+        self.ns_rows: dict[str, array] = {}
+        self.ns_compiled: dict = {}
+        self.ns_rows_upto = 0
+
+
 class DocStore:
-    def __init__(self):
+    """
+    Knowledge base behind prepare_ctx.
+    retrieval_mode selects how retrieve() ranks chunks:
+    - "vector": cosine similarity of query and chunk embeddings (default)
+    - "bm25": local lexical BM25, no embedding call at ingest or per query (the store keeps placeholder vectors)
+    - "hybrid": BM25 first; vector search is skipped when every lexical hit scores at least
+      lexical_skip, otherwise both scores are fused with weight alpha on the vector side.
+      With lexical_candidates > 0, vector scoring is limited to that many lexical hits.
+    Chunks whose SimHash is within dedup_distance bits of an indexed chunk, and whose shingles
+    overlap it by a Jaccard of at least 0.8, are neither embedded nor indexed again; their source is
+    added to that chunk's "sources" instead (dedup_distance < 0 disables this).
+    Results are cached per (normalized query, top_k, index version, namespace); every add_* bumps the
+    version, so cached results never outlive a change to the index. cache_size=0 disables it.
+    With a Metrics instance, ingest/embed/retrieve/search latencies and embedding cache counts are recorded.
+
+    Chunks ingested with namespace=... are tagged with metadata["namespace"]; chunks without one are shared.
+    retrieve(..., namespace=n) ranks only n's chunks plus the shared ones, taken from per-namespace row lists,
+    so many tenants can share one index without scoring each other's rows; without a namespace only the
+    shared chunks are ranked, and namespace=ALL_NAMESPACES opts into all of them. Near duplicates are only
+    collapsed within a namespace.
+    """
+    def __init__(self, embed_cache_path: str | None = None, embed_model=None, retrieval_mode: str = "vector",
+                 alpha: float = 0.5, lexical_skip: float = 0.9, lexical_candidates: int = 0,
+                 cache_size: int = 256, cache_ttl: float = 300.0, ingest_workers: int | None = None,
+                 embed_batch: int = 64, embed_concurrency: int = 4, chunk_size: int = 1024, chunk_overlap: int = 200,
+                 stream: bool = False, stream_batch: int = 512, spill_dir: str | None = None,
+                 dedup_distance: int = 3, metrics=None):
+        if retrieval_mode not in ("vector", "bm25", "hybrid"):
+            raise ValueError(f"Unknown retrieval_mode: {retrieval_mode}")
         self._sticky_docs = []
-        self._index = None
-        self._nodes = []
-        
-        # Lazy import to avoid hard dependency if not used
-        try:
-            from llama_index.core import VectorStoreIndex, Document
-            from llama_index.core.node_parser import SentenceSplitter
-            self.VectorStoreIndex = VectorStoreIndex
-            self.Document = Document
-            self.SentenceSplitter = SentenceSplitter
-            self._has_llama = True
-        except ImportError:
-            self._has_llama = False
+        self._index = _Index(None)
+        self._lock = threading.Lock()
+        self._embed_model = embed_model
+        self._embed_cache = None
+        self._mode = retrieval_mode
+        self._alpha = alpha
+        self._lexical_skip = lexical_skip
+        self._lexical_candidates = lexical_candidates
+        self._version = 0
+        self._cache = QueryCache(maxsize=cache_size, ttl=cache_ttl)
+        self._ingest_workers = ingest_workers
+        self._embed_batch = embed_batch
+        self._embed_concurrency = embed_concurrency
+        self._chunk_size = chunk_size
+        self._chunk_overlap = chunk_overlap
+        self._stream = stream
+        self._stream_batch = max(1, stream_batch)
+        self._spill_dir = spill_dir
+        self._dedup_distance = dedup_distance
+        self.last_report = None
+        self.metrics = metrics
+        # path -> {mtime, size, sha1[, namespace]} of every indexed file; refresh() diffs against it
+        self._manifest: dict[str, dict] = {}
+        self._refresh_lock = threading.Lock()
+
+        # set while no background build is running; retrieval waits on it
+        self._ready = threading.Event()
+        self._ready.set()
+        # thread running build_in_background's build(), which may refresh() a loaded snapshot
+        self._builder = None
+        self.build_error = None
+
+        # Lazy import to avoid hard dependency if not used; llama_index itself is only imported by ingestion
+        from importlib.util import find_spec
+        self._has_llama = find_spec("llama_index.core") is not None
+        if self._has_llama:
+            from src.vecstore import VectorStore
+            self._index = _Index(VectorStore())
+        else:
             print("Warning: llama-index not installed. DocStore will operate in limited mode.")
 
+        if embed_cache_path and self._has_llama:
+            from src.embed_cache import EmbeddingCache
+            self._embed_cache = EmbeddingCache(embed_cache_path)
+
+    @property
+    def _store(self):
+        # the live store; searches use the _Index they captured instead
+        return self._index.store
+
+    def build_in_background(self, build) -> threading.Thread:
+        """
+        Run build() (snapshot load or ingestion) on a daemon thread. retrieve() and get_chunk()
+        block only when called before it finishes; a failure is kept in build_error.
+        """
+        self._ready.clear()
+        self.build_error = None
+
+        def run():
+            try:
+                build()
+            except Exception as e:
+                self.build_error = e
+                print(f"Warning: background index build failed: {e}")
+            finally:
+                self._ready.set()
+
+        thread = self._builder = threading.Thread(target=run, name="docstore-build", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout)
+
     def add_sticky(self, text: str):
         """Add a sticky document that is always retrieved (or handled separately)."""
         self._sticky_docs.append(text)
+        self._bump_version()
+
+    def set_sticky(self, texts: list[str]):
+        """Replace the sticky documents (config reload); the version only changes if they did."""
+        texts = list(texts)
+        if texts != self._sticky_docs:
+            self._sticky_docs = texts
+            self._bump_version()
 
     def sticky(self):
         """Return all sticky documents."""
@@ -41,73 +214,620 @@ class DocStore:
 
     def add_file(self, file_path: str):
         """Add a file to the RAG index."""
-        if not self._has_llama:
-            return
-            
-        try:
-            from llama_index.core import SimpleDirectoryReader
-            # Load specific file
-            docs = SimpleDirectoryReader(input_files=[file_path]).load_data()
-            self._update_index(docs)
-        except Exception as e:
-            print(f"Error adding file {file_path}: {e}")
+        self._print_errors(self.ingest(files=[file_path]))
 
     def add_dir(self, dir_path: str):
         """Add a directory to the RAG index."""
+        self._print_errors(self.ingest(dirs=[dir_path]))
+
+    def _print_errors(self, report):
+        for path, error in report.errors.items():
+            print(f"Error adding {path}: {error}")
+
+    @timed_method("docstore.ingest")
+    def ingest(self, files=(), dirs=(), workers: int | None = None, progress=None, namespace: str | None = None):
+        """
+        Staged ingestion of files and directories:
+        1. read + chunk on a process pool
+        2. embed cache misses in batches with at most embed_concurrency requests in flight
+        3. one bulk insert into the index
+        Per-file failures are collected in the returned IngestReport (also kept as last_report);
+        progress(stage, done, total) is called as each stage advances.
+
+        With stream=True files are read lazily and chunked, embedded and indexed in windows of
+        stream_batch chunks; with spill_dir set each window is appended to the on-disk snapshot
+        and memory-mapped, so peak memory follows the window size rather than the corpus.
+        With namespace, the chunks are only retrieved for that namespace.
+        """
+        from src.ingest import IngestReport, chunk_files, default_workers, expand_sources, iter_chunks
+        if namespace == ALL_NAMESPACES:
+            raise ValueError(f"{ALL_NAMESPACES!r} is reserved for searching all namespaces")
+        report = IngestReport()
+        self.last_report = report
         if not self._has_llama:
+            return report
+        started = time.perf_counter()
+        paths = expand_sources(list(files), list(dirs), report.errors)
+        if self._stream:
+            window, owners = [], []
+            for i, chunk in iter_chunks(paths, self._chunk_size, self._chunk_overlap, report.errors, progress):
+                window.append(chunk)
+                owners.append(i)
+                if len(window) >= self._stream_batch:
+                    self._index_window(paths, window, owners, report, namespace=namespace)
+                    window, owners = [], []
+            self._index_window(paths, window, owners, report, namespace=namespace)
+        else:
+            workers = workers or self._ingest_workers or default_workers()
+            per_file = chunk_files(paths, workers, self._chunk_size, self._chunk_overlap, report.errors, progress)
+            owners = [i for i, chunks in enumerate(per_file) for _ in chunks]
+            chunks = [c for chunks in per_file for c in chunks]
+            self._index_window(paths, chunks, owners, report, progress, namespace)
+        if progress:
+            progress("index", report.chunks, report.chunks)
+
+        report.files = sum(1 for p in paths if p not in report.errors)
+        self._record(paths, report, namespace)
+        report.seconds = time.perf_counter() - started
+        return report
+
+    def _record(self, paths, report, namespace: str | None = None):
+        from src.ingest import file_fingerprint
+        for p in paths:
+            if p in report.errors:
+                continue
+            try:
+                self._manifest[p] = _tagged(file_fingerprint(p, self._manifest.get(p)), namespace)
+            except OSError:
+                # unreadable now: the next refresh re-reads it
+                self._manifest.pop(p, None)
+
+    @timed_method("docstore.refresh")
+    def refresh(self, files=(), dirs=(), progress=None, namespaces: dict | None = None):
+        """
+        Bring the index in line with files/dirs by diffing the file manifest (mtime, size, content hash):
+        only added or changed files are chunked and embedded again, chunks of changed and deleted files
+        are dropped (a merged near duplicate only loses that origin). The new index is built beside the
+        live one and swapped in at once, so retrieval keeps serving the old index meanwhile.
+        namespaces maps a namespace to its own (files, dirs); a file that moves to another namespace
+        counts as changed, and one listed twice stays in the first group listing it.
+        Returns an IngestReport with unchanged/removed counts; per-file errors keep the file's old chunks.
+        """
+        from src.ingest import IngestReport, expand_sources, file_fingerprint
+        report = IngestReport()
+        if not self._has_llama:
+            return report
+        if threading.current_thread() is not self._builder:
+            self._ready.wait()
+        with self._refresh_lock:
+            started = time.perf_counter()
+            manifest = dict(self._manifest)
+            # the same file may be listed as a relative path and found through a directory as an absolute one
+            by_abs = {os.path.abspath(p): p for p in manifest}
+            changed: dict[str | None, list[str]] = {}
+            current = set()
+            for namespace, (ns_files, ns_dirs) in {None: (files, dirs), **(namespaces or {})}.items():
+                for p in expand_sources(list(ns_files), list(ns_dirs), report.errors):
+                    if os.path.abspath(p) in current:
+                        continue
+                    current.add(os.path.abspath(p))
+                    if p not in manifest and os.path.abspath(p) in by_abs:
+                        manifest[p] = manifest.pop(by_abs[os.path.abspath(p)])
+                    try:
+                        fingerprint = _tagged(file_fingerprint(p, manifest.get(p)), namespace)
+                    except OSError as e:
+                        report.errors[p] = str(e)
+                        continue
+                    known = manifest.get(p, {})
+                    if known.get("sha1") == fingerprint["sha1"] and known.get("namespace") == fingerprint.get("namespace"):
+                        report.unchanged += 1
+                    else:
+                        changed.setdefault(namespace, []).append(p)
+                    manifest[p] = fingerprint
+            removed = {p for p in set(self._manifest) | self._indexed_sources()
+                       if os.path.abspath(p) not in current and p not in report.errors}
+            for p in removed:
+                manifest.pop(p, None)
+            report.removed = len(removed)
+            if changed or removed:
+                stale = {os.path.abspath(p) for p in [p for ps in changed.values() for p in ps] + list(removed)}
+                # a memory-mapped index is rebuilt as a new snapshot generation and mapped again, not copied into memory
+                snapshot = self._store.path
+                staged = self._staged(self._without_sources(stale, snapshot), manifest)
+                for namespace, ns_changed in changed.items():
+                    sub = staged.ingest(ns_changed, progress=progress, namespace=namespace)
+                    for p in sub.errors:
+                        manifest.pop(p, None)
+                    report.merge(sub)
+                if snapshot and len(staged._store):
+                    staged._store.model = self._model_name()
+                    staged._store.flush(snapshot)
+                if self._mode != "vector":
+                    staged._lexical()
+                with self._lock:
+                    self._index = staged._index
+                self._bump_version()
+            self._manifest = manifest
+            report.seconds = time.perf_counter() - started
+            self.last_report = report
+            return report
+
+    def _indexed_sources(self) -> set[str]:
+        return {s for meta in self._store.metas for s in (meta.get("sources") or [source_of(meta)])}
+
+    def _without_sources(self, stale: set[str], path: str | None = None):
+        """Copy of the store without chunks whose every origin (absolute path) is in stale; see VectorStore.subset for path."""
+        keep, metas = [], {}
+        for row, meta in enumerate(self._store.metas):
+            sources = meta.get("sources") or [source_of(meta)]
+            left = [s for s in sources if os.path.abspath(s) not in stale]
+            if not left:
+                continue
+            if len(left) != len(sources):
+                metas[len(keep)] = {**meta, "sources": left}
+            keep.append(row)
+        store = self._store.subset(keep, path)
+        for row, meta in metas.items():
+            store.update_meta(row, meta)
+        return store
+
+    def _staged(self, store, manifest: dict) -> "DocStore":
+        """A private DocStore over store, sharing models and caches, for building an index off to the side."""
+        staged = copy.copy(self)
+        staged._index = _Index(store)
+        staged._lock = threading.Lock()
+        staged._cache = QueryCache(maxsize=0)
+        staged._ready = threading.Event()
+        staged._ready.set()
+        # never append into the live snapshot directory
+        staged._spill_dir = None
+        staged._manifest = manifest
+        return staged
+
+    def _index_window(self, paths, chunks, owners, report, progress=None, namespace: str | None = None):
+        """Embed and insert one batch of chunks; files with a failed embedding batch are reported and skipped."""
+        if not chunks:
+            # nothing to embed: do not resolve (or fail to resolve) an embedding model
             return
+        if namespace:
+            for c in chunks:
+                c.metadata["namespace"] = namespace
+        hashes = None
+        if self._dedup_distance >= 0:
+            # near duplicates are dropped before embedding, so they cost no embedding call
+            chunks, owners, hashes = self._collapse_near_duplicates(chunks, owners, report)
+            if not chunks:
+                return
+        if self._mode == "bm25":
+            import numpy as np
+            # lexical search needs no vectors, so no embedder either; placeholders keep the store's layout
+            vectors, error = [np.zeros(self._store.dim or 1, dtype=np.float32)] * len(chunks), ""
+        else:
+            vectors, error = self._embed_texts([c.embed_text for c in chunks], report, progress)
+        failed = {owners[j] for j, v in enumerate(vectors) if v is None}
+        for i in failed:
+            report.errors[paths[i]] = f"embedding failed: {error}"
+        keep = [j for j in range(len(chunks)) if owners[j] not in failed]
+        report.chunks += self._update_index([chunks[j] for j in keep], [vectors[j] for j in keep],
+                                            None if hashes is None else [hashes[j] for j in keep])
+        if self._stream and self._spill_dir and keep:
+            self._store.model = self._model_name()
+            self._store.flush(self._spill_dir)
 
-        try:
-            from llama_index.core import SimpleDirectoryReader
-            # Load directory
-            docs = SimpleDirectoryReader(input_dir=dir_path, recursive=True).load_data()
-            self._update_index(docs)
-        except Exception as e:
-            print(f"Error adding dir {dir_path}: {e}")
+    def _update_index(self, chunks, vectors, hashes=None) -> int:
+        """Bulk-insert embedded chunks with their SimHashes, if known. Returns the number of new rows."""
+        if not chunks:
+            return 0
+        texts = [c.text for c in chunks]
+        metas = [dict(c.metadata) for c in chunks]
+        ids = [chunk_id(source_of(m), t, m.get("namespace")) for m, t in zip(metas, texts)]
+        index = self._index
+        base = len(index.store)
+        index.store.add(ids, texts, metas, vectors)
+        if hashes is not None:
+            with index.simhash_lock:
+                # otherwise _near_dup_index fingerprints the new rows when it next catches up
+                if index.simhashes is not None and len(index.simhashes) == base:
+                    for h in hashes:
+                        index.simhashes.add(h)
+        self._bump_version()
+        if self._mode != "vector":
+            self._lexical()
+        return len(chunks)
+
+    def _collapse_near_duplicates(self, chunks, owners, report):
+        """
+        Drop chunks that near-duplicate an indexed (or earlier) chunk of their namespace, merging their
+        sources into it. A SimHash match counts only once the shingle sets confirm it.
+        Returns the kept chunks, their owners and their SimHashes.
+        """
+        from src.dedup import SimHashIndex, fingerprint, resemblance, shingles
+        store = self._store
+        indexed = self._near_dup_index()
+        window = SimHashIndex(self._dedup_distance)
+        kept, kept_owners, kept_shingles, hashes = [], [], [], []
+
+        def match(candidates, namespace_of, shingles_of, features):
+            # another namespace's chunk never absorbs this one, so no sources leak across tenants
+            return next((row for row in candidates if namespace_of(row) == namespace
+                         and resemblance(shingles_of(row), features) >= _NEAR_DUP_RESEMBLANCE), None)
+
+        for chunk, owner in zip(chunks, owners):
+            features = shingles(chunk.text)
+            h = fingerprint(features)
+            namespace = chunk.metadata.get("namespace")
+            row = match(indexed.candidates(h), lambda r: store.metas[r].get("namespace"),
+                        lambda r: shingles(store.text(r)), features)
+            if row is not None:
+                meta = dict(store.metas[row])
+                if _merge_source(meta, source_of(chunk.metadata)):
+                    store.update_meta(row, meta)
+            else:
+                row = match(window.candidates(h), lambda r: kept[r].metadata.get("namespace"),
+                            lambda r: kept_shingles[r], features)
+                if row is None:
+                    window.add(h)
+                    kept.append(chunk)
+                    kept_owners.append(owner)
+                    kept_shingles.append(features)
+                    hashes.append(h)
+                    continue
+                _merge_source(kept[row].metadata, source_of(chunk.metadata))
+            report.duplicates += 1
+        return kept, kept_owners, hashes
+
+    def _near_dup_index(self):
+        """SimHash index over the store, catching up on rows it has not fingerprinted yet."""
+        from src.dedup import SimHashIndex, simhash
+        index = self._index
+        with index.simhash_lock:
+            if index.simhashes is None:
+                index.simhashes = SimHashIndex(self._dedup_distance)
+            for row in range(len(index.simhashes), len(index.store)):
+                index.simhashes.add(simhash(index.store.text(row)))
+            return index.simhashes
+
+    def _resolve_embed_model(self):
+        if self._embed_model is None:
+            from llama_index.core import Settings
+            self._embed_model = Settings.embed_model
+        return self._embed_model
+
+    def _model_name(self) -> str:
+        if self._mode == "bm25":
+            return _LEXICAL_ONLY
+        model = self._resolve_embed_model()
+        return getattr(model, "model_name", "") or type(model).__name__
 
-    def _update_index(self, docs):
-        """Update the internal index with new documents."""
-        if not docs:
+    def _embed_texts(self, texts: list[str], report, progress=None) -> tuple[list, str]:
+        """
+        Embed texts, serving unchanged chunks from the on-disk cache.
+        Returns vectors aligned with texts (None where a batch failed) and the first batch error.
+        """
+        from src.ingest import embed_batches
+        model = self._resolve_embed_model()
+        model_name = self._model_name()
+        keys = [self._embed_cache.key(t, model_name) if self._embed_cache is not None else t for t in texts]
+        known = self._embed_cache.get_many(keys) if self._embed_cache is not None else {}
+        report.cached += sum(1 for k in keys if k in known)
+
+        # Identical chunks are embedded once
+        missing = list(dict.fromkeys(k for k in keys if k not in known))
+        text_by_key = dict(zip(keys, texts))
+        with timer(self.metrics, "docstore.embed"):
+            vectors, failed = embed_batches([text_by_key[k] for k in missing], model.get_text_embedding_batch,
+                                            self._embed_batch, self._embed_concurrency, progress)
+        fresh = {k: v for k, v in zip(missing, vectors) if v is not None}
+        if self._embed_cache is not None:
+            self._embed_cache.put_many(fresh)
+        known.update(fresh)
+        report.embedded += len(fresh)
+        if self.metrics is not None:
+            self.metrics.count("embed.cached", len(keys) - len(missing))
+            self.metrics.count("embed.computed", len(fresh))
+        return [known.get(k) for k in keys], next(iter(failed.values()), "")
+
+    def save_snapshot(self, path: str):
+        """Persist vectors and the chunk table so the next start can skip ingestion."""
+        if not self._has_llama or not len(self._store):
             return
-            
-        # Parse documents into nodes
-        parser = self.SentenceSplitter()
-        new_nodes = parser.get_nodes_from_documents(docs)
-        self._nodes.extend(new_nodes)
-        
-        # Rebuild index (Simplistic approach for demo; in production, use ingestion pipeline)
-        # Note: This is expensive for large datasets; prefer incremental updates or persistent storage
-        self._index = self.VectorStoreIndex(self._nodes)
-
-    def retrieve(self, query: str, top_k: int = 3):
-        """
-        Retrieve documents relevant to the query.
+        self._store.model = self._model_name()
+        self._store.save(path)
+        tmp = os.path.join(path, _MANIFEST + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(path, _MANIFEST))
+
+    def load_snapshot(self, path: str) -> bool:
+        """Replace the index with a memory-mapped snapshot. Returns False if none is usable."""
+        if not self._has_llama:
+            return False
+        from src.vecstore import VectorStore
+        store = VectorStore.open(path)
+        if store is None:
+            return False
+        # bm25 mode only reads the texts, so any snapshot will do
+        if store.model and self._mode != "bm25" and store.model != self._model_name():
+            print(f"Warning: snapshot {path} was built with {store.model}; ignoring it.")
+            return False
+        manifest_path = os.path.join(path, _MANIFEST)
+        manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        index = _Index(store)
+        if self._mode != "vector":
+            # built before the swap, so the first lexical query does not wait on it
+            self._lexical(index)
+        with self._lock:
+            self._index = index
+            self._manifest = manifest
+        self._bump_version()
+        return True
+
+    @property
+    def version(self) -> int:
+        """Index version; changes whenever sticky docs or indexed chunks change."""
+        return self._version
+
+    def _bump_version(self):
+        with self._lock:
+            self._version += 1
+
+    def cache_stats(self) -> dict:
+        """Query-result cache counters: hits, misses, hit_rate, size, plus the current index version."""
+        return {**self._cache.stats(), "version": self._version}
+
+    def _lexical(self, index: _Index | None = None):
+        """BM25 index over index's store (the live one by default), catching up on rows added since the last call."""
+        from src.bm25 import BM25Index
+        index = index or self._index
+        with index.bm25_lock:
+            if index.bm25 is None:
+                index.bm25 = BM25Index()
+            n = len(index.bm25)
+            if n < len(index.store):
+                index.bm25.add([index.store.text(row) for row in range(n, len(index.store))])
+            return index.bm25
+
+    @timed_method("docstore.retrieve")
+    def retrieve(self, query: str, top_k: int = 3, namespace: str | None = None):
+        """
+        Retrieve documents relevant to the query, from namespace and the shared chunks when namespace is given,
+        from the shared chunks alone without one, and from every chunk with namespace=ALL_NAMESPACES.
         Returns a list of SimpleDocument objects with 'page_content' and 'metadata'.
         """
-        if not self._has_llama or not self._index:
+        self._ready.wait()
+        index = self._index
+        if not self._has_llama or not len(index.store):
+            return []
+
+        key = (normalize_query(query), top_k, self._version, namespace or None)
+        hits = self._cache.get(key)
+        if hits is None:
+            with timer(self.metrics, "docstore.search"):
+                hits = self._hits(index, self._search(index, query, top_k, namespace))
+            self._cache.put(key, hits)
+        return self._documents(hits)
+
+    @timed_method("docstore.retrieve")
+    async def aretrieve(self, query: str, top_k: int = 3, namespace: str | None = None):
+        """retrieve() with the query embedding awaited, so one event loop can serve many turns."""
+        if not self._ready.is_set():
+            await asyncio.to_thread(self._ready.wait)
+        # the awaited embedding may outlast a refresh(); everything below reads this one index
+        index = self._index
+        if not self._has_llama or not len(index.store):
             return []
+        key = (normalize_query(query), top_k, self._version, namespace or None)
+        hits = self._cache.get(key)
+        if hits is None:
+            with timer(self.metrics, "docstore.search"):
+                hits = self._hits(index, await self._asearch(index, query, top_k, namespace))
+            self._cache.put(key, hits)
+        return self._documents(hits)
 
-        retriever = self._index.as_retriever(similarity_top_k=top_k)
-        results = retriever.retrieve(query)
-        
-        output = []
-        for node_with_score in results:
-            node = node_with_score.node
-            # Extract content
-            content = node.get_content()
-            
-            # Extract metadata and inject source URL/Path
-            # LlamaIndex SimpleDirectoryReader puts file path in 'file_path' key by default
-            metadata = node.metadata.copy() if node.metadata else {}
-            
-            # Map LlamaIndex 'file_path' to generic 'source' for loader.py
-            if "file_path" in metadata:
-                metadata["source"] = metadata["file_path"]
-            elif "file_name" in metadata:
-                metadata["source"] = metadata["file_name"]
+    @timed_method("docstore.retrieve_batch")
+    def retrieve_batch(self, queries: list[str], top_k: int = 3, namespace: str | None = None) -> list[list]:
+        """
+        retrieve() for several queries at once (all in one namespace): cached and lexically answered queries
+        skip the model, the rest are embedded in one get_text_embedding_batch call and scored as one matrix product.
+        Queries are embedded as documents, which equals get_query_embedding for symmetric models.
+        Returns one document list per query, in order.
+        """
+        self._ready.wait()
+        index = self._index
+        if not self._has_llama or not len(index.store):
+            return [[] for _ in queries]
+        results: list = [None] * len(queries)
+        pending: dict[tuple, list[int]] = {}
+        for i, query in enumerate(queries):
+            key = (normalize_query(query), top_k, self._version, namespace or None)
+            hits = self._cache.get(key)
+            if hits is not None:
+                results[i] = hits
             else:
-                metadata["source"] = "unknown"
+                pending.setdefault(key, []).append(i)
+        if pending:
+            with timer(self.metrics, "docstore.search"):
+                for key, rows in self._search_many(index, [queries[idx[0]] for idx in pending.values()], top_k,
+                                                   list(pending), namespace):
+                    hits = self._hits(index, rows)
+                    self._cache.put(key, hits)
+                    for i in pending[key]:
+                        results[i] = hits
+        return [self._documents(hits) for hits in results]
 
-            output.append(SimpleDocument(content=content, metadata=metadata))
-            
-        return output
+    def _search_many(self, index: _Index, queries: list[str], top_k: int, keys: list, namespace: str | None = None):
+        """(key, rows) per query; one embedding call and one scoring pass for those lexical search cannot settle."""
+        rows = self._namespace_rows(index, namespace)
+        if rows is not None and not len(rows):
+            for key in keys:
+                yield key, []
+            return
+        vector = []
+        for key, query in zip(keys, queries):
+            lexical, best, done = self._lexical_stage(index, query, top_k, rows)
+            if done:
+                yield key, best
+            else:
+                vector.append((key, query, lexical, best))
+        if not vector:
+            return
+        try:
+            query_vecs = self._resolve_embed_model().get_text_embedding_batch([q for _, q, _, _ in vector])
+        except Exception as e:
+            if any(lexical is None for _, _, lexical, _ in vector):
+                raise
+            print(f"Warning: query embedding failed, using lexical results only: {e}")
+            for key, _, _, best in vector:
+                yield key, best
+            return
+        if self.metrics is not None:
+            self.metrics.observe("docstore.embed_batch_size", len(vector))
+        scores = index.store.scores_many(query_vecs, rows)
+        for (key, _, lexical, _), row_scores in zip(vector, scores):
+            yield key, self._rank(index, None, lexical, top_k, row_scores, rows)
+
+    def _hits(self, index: _Index, rows: list[tuple[int, float]]) -> list[tuple[str, dict]]:
+        hits = []
+        for row, score in rows:
+            metadata = self._row_metadata(index.store, row)
+            metadata["score"] = score
+            hits.append((index.store.text(row), metadata))
+        return hits
+
+    @staticmethod
+    def _documents(hits: list[tuple[str, dict]]):
+        # fresh wrappers so callers cannot mutate cached entries
+        return [SimpleDocument(content=content, metadata=dict(metadata)) for content, metadata in hits]
+
+    def get_chunk(self, chunk_id: str):
+        """Look up an indexed chunk by its stable id; returns a SimpleDocument or None."""
+        self._ready.wait()
+        index = self._index
+        row = self._row_of(index, chunk_id)
+        if row is None:
+            return None
+        return SimpleDocument(content=index.store.text(row), metadata=self._row_metadata(index.store, row))
+
+    def _row_of(self, index: _Index, chunk_id: str) -> int | None:
+        with self._lock:
+            for row in range(index.id_rows_upto, len(index.store)):
+                index.id_rows.setdefault(index.store.ids[row], row)
+            index.id_rows_upto = len(index.store)
+            return index.id_rows.get(chunk_id)
+
+    @staticmethod
+    def _row_metadata(store, row: int) -> dict:
+        # Inject source URL/Path; map LlamaIndex 'file_path' to generic 'source' for loader.py;
+        # collapsed near duplicates carry every origin
+        metadata = dict(store.metas[row])
+        metadata["source"] = ", ".join(metadata.get("sources") or [source_of(metadata)])
+        metadata["chunk_id"] = store.ids[row]
+        return metadata
+
+    def _namespace_rows(self, index: _Index, namespace: str | None):
+        """
+        Sorted rows of index visible to namespace: its own and the shared ones, only the shared ones
+        without a namespace, or None for the whole store (ALL_NAMESPACES, or no namespaced chunks at all).
+        """
+        if namespace == ALL_NAMESPACES:
+            return None
+        import numpy as np
+        with self._lock:
+            if index.ns_rows_upto < len(index.store):
+                for row in range(index.ns_rows_upto, len(index.store)):
+                    index.ns_rows.setdefault(index.store.metas[row].get("namespace") or "", array("i")).append(row)
+                index.ns_rows_upto = len(index.store)
+                index.ns_compiled = {}
+            if not namespace and not index.ns_rows.keys() - {""}:
+                return None
+            parts = []
+            for name in dict.fromkeys((namespace or "", "")):
+                rows = index.ns_compiled.get(name)
+                if rows is None and name in index.ns_rows:
+                    rows = index.ns_compiled[name] = np.array(index.ns_rows[name], dtype=np.int64)
+                if rows is not None:
+                    parts.append(rows)
+        if len(parts) < 2:
+            return parts[0] if parts else np.empty(0, dtype=np.int64)
+        rows = np.concatenate(parts)
+        rows.sort(kind="stable")
+        return rows
+
+    def _search(self, index: _Index, query: str, top_k: int, namespace: str | None = None) -> list[tuple[int, float]]:
+        rows = self._namespace_rows(index, namespace)
+        if rows is not None and not len(rows):
+            return []
+        lexical, best, done = self._lexical_stage(index, query, top_k, rows)
+        if done:
+            return best
+        try:
+            query_vec = self._resolve_embed_model().get_query_embedding(query)
+        except Exception as e:
+            if lexical is None:
+                raise
+            print(f"Warning: query embedding failed, using lexical results only: {e}")
+            return best
+        return self._rank(index, query_vec, lexical, top_k, rows=rows)
+
+    async def _asearch(self, index: _Index, query: str, top_k: int, namespace: str | None = None) -> list[tuple[int, float]]:
+        rows = self._namespace_rows(index, namespace)
+        if rows is not None and not len(rows):
+            return []
+        lexical, best, done = self._lexical_stage(index, query, top_k, rows)
+        if done:
+            return best
+        try:
+            query_vec = await self._resolve_embed_model().aget_query_embedding(query)
+        except Exception as e:
+            if lexical is None:
+                raise
+            print(f"Warning: query embedding failed, using lexical results only: {e}")
+            return best
+        return self._rank(index, query_vec, lexical, top_k, rows=rows)
+
+    def _lexical_stage(self, index: _Index, query: str, top_k: int, rows=None):
+        """
+        (lexical scores, best lexical hits, done); done means no query embedding is needed.
+        With rows, the scores are aligned with rows and the hits are still store rows.
+        """
+        from src.vecstore import top_k_rows
+        if self._mode == "vector":
+            return None, [], False
+        lexical = self._lexical(index).scores(query, normalize=True, rows=rows)
+        best = [(row if rows is None else int(rows[row]), score) for row, score in top_k_rows(lexical, top_k) if score > 0]
+        # hybrid: confident lexical hits answer without an embedding round-trip
+        done = self._mode == "bm25" or (len(best) == top_k and best[-1][1] >= self._lexical_skip)
+        return lexical, best, done
+
+    def _rank(self, index: _Index, query_vec, lexical, top_k: int, scores=None, rows=None) -> list[tuple[int, float]]:
+        """
+        Rank by vector similarity (fused with lexical scores in hybrid mode); scores are precomputed similarities.
+        With rows only those store rows are ranked, and lexical and scores are aligned with them.
+        """
+        import numpy as np
+        from src.vecstore import top_k_rows
+
+        def similarity(picked=None):
+            # picked: positions to score, within rows or the store; None scores all of them
+            if scores is not None:
+                return scores if picked is None else scores[picked]
+            if rows is not None:
+                return index.store.scores(query_vec, rows if picked is None else rows[picked])
+            return index.store.scores(query_vec, picked)
+
+        if lexical is None:
+            ranked = top_k_rows(similarity(), top_k)
+        else:
+            hits = np.flatnonzero(lexical)
+            if self._lexical_candidates and len(hits) >= self._lexical_candidates:
+                picked = hits[np.argsort(-lexical[hits], kind="stable")[:self._lexical_candidates]]
+                fused = self._alpha * np.clip(similarity(picked), 0, None) + (1 - self._alpha) * lexical[picked]
+                ranked = [(int(picked[i]), score) for i, score in top_k_rows(fused, top_k)]
+            else:
+                # rows appended by a concurrent ingest after the BM25 catch-up are left to the next query
+                fused = self._alpha * np.clip(similarity()[:len(lexical)], 0, None) + (1 - self._alpha) * lexical
+                ranked = top_k_rows(fused, top_k)
+        return ranked if rows is None else [(int(rows[i]), score) for i, score in ranked]
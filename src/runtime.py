@@ -1,15 +1,61 @@
-from langchain_core.messages import HumanMessage
-from src.chat_state import ChatState
+from contextlib import contextmanager
+from typing import AsyncIterator
+
+@contextmanager
+def _instrumented(app, thread_id: str):
+    # turn latency, and a sampled cProfile of the turn, when the app carries a Metrics (app.metrics)
+    metrics = getattr(app, "metrics", None)
+    if metrics is None:
+        yield
+        return
+    with metrics.profile(f"turn-{thread_id}"), metrics.timer("turn"):
+        yield
 
 def send_user_message(app, thread_id: str, text: str):
     """
     Send a user message to the LangGraph app.
     """
+    from langchain_core.messages import HumanMessage
+    config = {"configurable": {"thread_id": thread_id}}
+    with _instrumented(app, thread_id):
+        app.invoke(
+            {"messages": [HumanMessage(content=text)]},
+            config=config
+        )
+
+async def asend_user_message(app, thread_id: str, text: str):
+    """
+    Async send_user_message: many threads' turns can overlap on one event loop.
+    """
+    from langchain_core.messages import HumanMessage
     config = {"configurable": {"thread_id": thread_id}}
-    app.invoke(
-        {"messages": [HumanMessage(content=text)]},
-        config=config
-    )
+    with _instrumented(app, thread_id):
+        await app.ainvoke(
+            {"messages": [HumanMessage(content=text)]},
+            config=config
+        )
+
+async def astream_user_message(app, thread_id: str, text: str) -> AsyncIterator[str]:
+    """
+    Send a user message and yield the reply's text as the model produces it.
+    Only the chat_llm node's output is yielded (tool results and history summaries are not);
+    a model that cannot stream yields its whole answer as one piece.
+    """
+    from langchain_core.messages import HumanMessage
+    config = {"configurable": {"thread_id": thread_id}}
+    with _instrumented(app, thread_id):
+        async for message, metadata in app.astream(
+            {"messages": [HumanMessage(content=text)]},
+            config=config,
+            stream_mode="messages",
+        ):
+            if metadata.get("langgraph_node") != "chat_llm" or getattr(message, "type", None) not in ("ai", "AIMessageChunk"):
+                continue
+            content = message.content
+            if isinstance(content, list):
+                content = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+            if content:
+                yield content
 
 def get_state(app, thread_id: str):
     """
@@ -17,3 +63,7 @@ def get_state(app, thread_id: str):
     """
     config = {"configurable": {"thread_id": thread_id}}
     return app.get_state(config)
+
+async def aget_state(app, thread_id: str):
+    config = {"configurable": {"thread_id": thread_id}}
+    return await app.aget_state(config)
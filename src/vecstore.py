@@ -0,0 +1,357 @@
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+SNAPSHOT_VERSION = 1
+_HEADER = "snapshot.json"
+_VECTORS = "vectors.f32"
+_TEXTS = "texts.bin"
+_OFFSETS = "offsets.i64"
+_CHUNKS = "chunks.jsonl"
+# a snapshot directory holds generation subdirectories and CURRENT, naming the live one
+_CURRENT = "CURRENT"
+_GENERATION = "gen-"
+# rows copied per block when writing a generation or gathering rows to score
+_BLOCK = 4096
+# row sets at least 1/_FULL_PASS of the store are scored in one pass over the matrix instead of gathered
+_FULL_PASS = 3
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def _current_dir(path: str) -> str | None:
+    """Directory holding the live generation of the snapshot at path, or None if there is none."""
+    try:
+        with open(os.path.join(path, _CURRENT), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        # snapshots written before generations keep their files at the top level
+        return os.path.abspath(path) if os.path.exists(os.path.join(path, _HEADER)) else None
+    return os.path.abspath(os.path.join(path, name)) if name else None
+
+
+def _publish(path: str, directory: str):
+    """Point CURRENT at directory in one os.replace, then drop generations older than the one it replaced."""
+    previous = _current_dir(path)
+    tmp = os.path.join(path, f"{_CURRENT}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(directory))
+    os.replace(tmp, os.path.join(path, _CURRENT))
+    if previous is None or not os.path.basename(previous).startswith(_GENERATION):
+        return
+    # the previous generation stays for readers that resolved CURRENT just before the switch;
+    # processes that mapped older files keep reading them after the unlink
+    for name in os.listdir(path):
+        if name.startswith(_GENERATION) and name < os.path.basename(previous):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+        elif name in (_HEADER, _VECTORS, _TEXTS, _OFFSETS, _CHUNKS):
+            os.remove(os.path.join(path, name))
+
+
+class VectorStore:
+    """
+    Row-aligned float32 matrix of unit vectors plus a compact chunk table (id, text, metadata).
+    Rows opened from a snapshot stay memory-mapped, so worker processes share their pages;
+    rows added afterwards live in an in-memory tail that is searched together with them.
+    save() writes a new generation of the snapshot and switches CURRENT to it, so a process opening
+    the snapshot meanwhile gets either the old or the new one; flush() appends to the live generation,
+    whose header (written last) bounds what readers use.
+    """
+    def __init__(self, dim: int | None = None, model: str = ""):
+        self.dim = dim
+        self.model = model
+        self.ids: list[str] = []
+        self.metas: list[dict] = []
+        # snapshot segment (read-only memmaps)
+        self._base = None
+        self._base_blob = None
+        self._base_offsets = None
+        self._n_base = 0
+        self._chunks_bytes = 0
+        self._metas_dirty = False
+        # snapshot directory and the generation directory the base segment is mapped from
+        self.path = None
+        self._dir = None
+        # in-memory tail, grown by doubling
+        self._tail = None
+        self._n_tail = 0
+        self._tail_texts: list[str] = []
+
+    def __len__(self) -> int:
+        return self._n_base + self._n_tail
+
+    def add(self, ids: list[str], texts: list[str], metas: list[dict], vectors) -> range:
+        """Append rows and return their row numbers."""
+        mat = np.asarray(vectors, dtype=np.float32)
+        if mat.ndim != 2 or len(mat) != len(ids):
+            raise ValueError("vectors must be a (n, dim) matrix aligned with ids")
+        if self.dim is None:
+            self.dim = mat.shape[1]
+        elif mat.shape[1] != self.dim:
+            raise ValueError(f"embedding dim {mat.shape[1]} does not match store dim {self.dim}")
+        need = self._n_tail + len(mat)
+        if self._tail is None or need > len(self._tail):
+            cap = max(need, 2 * (0 if self._tail is None else len(self._tail)), 64)
+            grown = np.empty((cap, self.dim), dtype=np.float32)
+            if self._n_tail:
+                grown[:self._n_tail] = self._tail[:self._n_tail]
+            self._tail = grown
+        self._tail[self._n_tail:need] = _normalize(mat)
+        start = len(self)
+        self._n_tail = need
+        self.ids.extend(ids)
+        self.metas.extend(metas)
+        self._tail_texts.extend(texts)
+        return range(start, len(self))
+
+    def update_meta(self, row: int, meta: dict):
+        """Replace a row's metadata; snapshot rows are rewritten on the next flush."""
+        self.metas[row] = meta
+        if row < self._n_base:
+            self._metas_dirty = True
+
+    def subset(self, rows, path: str | None = None) -> "VectorStore":
+        """
+        Copy of the given rows (vectors, texts, ids, metadata), in that order; in memory, or with path
+        written block by block as a new generation of the snapshot at path and memory-mapped from it.
+        That generation is only published (made CURRENT) by the copy's first flush(path).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if path is not None and len(rows):
+            store = VectorStore._open_dir(path, self._write_generation(path, rows))
+            if store is not None:
+                return store
+        store = VectorStore(dim=self.dim, model=self.model)
+        if not len(rows):
+            return store
+        store.add([self.ids[r] for r in rows], [self.text(r) for r in rows], [dict(self.metas[r]) for r in rows],
+                  self._vectors(rows))
+        return store
+
+    def _vectors(self, rows) -> np.ndarray:
+        rows = np.asarray(rows, dtype=np.int64)
+        mat = np.empty((len(rows), self.dim), dtype=np.float32)
+        in_base = rows < self._n_base
+        if in_base.any():
+            mat[in_base] = self._base[rows[in_base]]
+        if not in_base.all():
+            mat[~in_base] = self._tail[rows[~in_base] - self._n_base]
+        return mat
+
+    def text(self, row: int) -> str:
+        if row < self._n_base:
+            lo, hi = self._base_offsets[row], self._base_offsets[row + 1]
+            return bytes(self._base_blob[lo:hi]).decode("utf-8")
+        return self._tail_texts[row - self._n_base]
+
+    def scores(self, query_vec, rows=None) -> np.ndarray:
+        """Cosine similarity of the query against every row, or only against the given rows."""
+        q = _normalize(np.asarray(query_vec, dtype=np.float32))
+        return self._scores_all(q) if rows is None else self._scores_rows(q, rows)
+
+    def scores_many(self, query_vecs, rows=None) -> np.ndarray:
+        """(queries, rows) cosine similarities of several queries, as one matrix product per segment."""
+        q = _normalize(np.asarray(query_vecs, dtype=np.float32)).T
+        return (self._scores_all(q) if rows is None else self._scores_rows(q, rows)).T
+
+    def _scores_all(self, q: np.ndarray) -> np.ndarray:
+        # q is (dim,) or (dim, queries); one product per segment, nothing copied out of the memmap
+        parts = []
+        if self._n_base:
+            parts.append(self._base @ q)
+        if self._n_tail:
+            parts.append(self._tail[:self._n_tail] @ q)
+        if not parts:
+            return np.empty((0,) + q.shape[1:], dtype=np.float32)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def _scores_rows(self, q: np.ndarray, rows) -> np.ndarray:
+        """
+        Scores of the given rows: a large share of the store is scored in one pass and picked out,
+        a small one gathered block by block, so neither copies most of the matrix.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) * _FULL_PASS >= len(self):
+            return self._scores_all(q)[rows]
+        out = np.empty((len(rows),) + q.shape[1:], dtype=np.float32)
+        for lo in range(0, len(rows), _BLOCK):
+            block = rows[lo:lo + _BLOCK]
+            in_base = block < self._n_base
+            if in_base.all():
+                out[lo:lo + len(block)] = self._base[block] @ q
+                continue
+            part = np.empty((len(block),) + q.shape[1:], dtype=np.float32)
+            if in_base.any():
+                part[in_base] = self._base[block[in_base]] @ q
+            part[~in_base] = self._tail[block[~in_base] - self._n_base] @ q
+            out[lo:lo + len(block)] = part
+        return out
+
+    def search(self, query_vec, top_k: int = 3) -> list[tuple[int, float]]:
+        """Return (row, score) pairs of the top_k most similar rows, best first."""
+        return top_k_rows(self.scores(query_vec), top_k)
+
+    def save(self, path: str):
+        """Write the store as a new generation of the snapshot at path and make it CURRENT."""
+        if self.path == os.path.abspath(path):
+            self.flush(path)
+            return
+        _publish(path, self._write_generation(path, range(len(self))))
+
+    def _write_generation(self, path: str, rows) -> str:
+        """Write the given rows as a fresh generation directory under path (not yet CURRENT) and return it."""
+        directory = os.path.abspath(os.path.join(path, f"{_GENERATION}{time.time_ns()}"))
+        os.makedirs(directory)
+        offsets = [0]
+        chunks_bytes = 0
+        with open(os.path.join(directory, _VECTORS), "wb") as vectors, \
+                open(os.path.join(directory, _TEXTS), "wb") as texts, \
+                open(os.path.join(directory, _CHUNKS), "wb") as chunks:
+            for start in range(0, len(rows), _BLOCK):
+                block = rows[start:start + _BLOCK]
+                vectors.write(self._vectors(block).tobytes())
+                for r in block:
+                    offsets.append(offsets[-1] + texts.write(self.text(int(r)).encode("utf-8")))
+                chunks_bytes += chunks.write(self._chunk_lines(block))
+        np.asarray(offsets, dtype=np.int64).tofile(os.path.join(directory, _OFFSETS))
+        self._write_header(os.path.join(directory, _HEADER), len(rows), chunks_bytes)
+        return directory
+
+    def flush(self, path: str):
+        """
+        Append the in-memory tail to the snapshot at path and re-map it, leaving the tail empty.
+        Streaming ingestion calls this after every window so resident memory stays bounded by the window.
+        """
+        if self.path != os.path.abspath(path):
+            # first flush into this snapshot: write a generation whole, then append to it from here on
+            directory = self._write_generation(path, range(len(self)))
+            _publish(path, directory)
+        elif self._n_tail or self._metas_dirty:
+            directory = self._dir
+            # drop bytes of an append that crashed before its header was written
+            files = {name: os.path.join(directory, name) for name in (_VECTORS, _TEXTS, _OFFSETS, _CHUNKS)}
+            os.truncate(files[_VECTORS], self._n_base * self.dim * 4)
+            os.truncate(files[_TEXTS], int(self._base_offsets[-1]))
+            os.truncate(files[_OFFSETS], (self._n_base + 1) * 8)
+            os.truncate(files[_CHUNKS], self._chunks_bytes)
+            if self._n_tail:
+                with open(files[_VECTORS], "ab") as f:
+                    f.write(self._tail[:self._n_tail].tobytes())
+            offsets = []
+            end = int(self._base_offsets[-1])
+            with open(files[_TEXTS], "ab") as f:
+                for text in self._tail_texts:
+                    end += f.write(text.encode("utf-8"))
+                    offsets.append(end)
+            with open(files[_OFFSETS], "ab") as f:
+                f.write(np.asarray(offsets, dtype=np.int64).tobytes())
+            if self._metas_dirty:
+                # metadata of already-written rows changed: rewrite the (small) chunk table whole
+                with open(files[_CHUNKS] + ".tmp", "wb") as f:
+                    chunks_bytes = f.write(self._chunk_lines(range(len(self))))
+                os.replace(files[_CHUNKS] + ".tmp", files[_CHUNKS])
+            else:
+                with open(files[_CHUNKS], "ab") as f:
+                    chunks_bytes = self._chunks_bytes + f.write(self._chunk_lines(range(self._n_base, len(self))))
+            tmp_header = os.path.join(directory, _HEADER + ".tmp")
+            self._write_header(tmp_header, len(self), chunks_bytes)
+            os.replace(tmp_header, os.path.join(directory, _HEADER))
+            if _current_dir(path) != directory:
+                # a generation written by subset(path=...) goes live with its first flush
+                _publish(path, directory)
+        else:
+            return
+        self._map(path, directory, len(self), self._read_header(directory)["chunks_bytes"])
+        self._tail = None
+        self._n_tail = 0
+        self._tail_texts = []
+        self._metas_dirty = False
+
+    def _chunk_lines(self, rows) -> bytes:
+        return "".join(
+            json.dumps({"id": self.ids[r], "metadata": self.metas[r]}, ensure_ascii=False, default=str) + "\n"
+            for r in rows
+        ).encode("utf-8")
+
+    def _write_header(self, path: str, count: int, chunks_bytes: int):
+        header = {"version": SNAPSHOT_VERSION, "count": count, "dim": self.dim, "model": self.model, "chunks_bytes": chunks_bytes}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+
+    @staticmethod
+    def _read_header(path: str) -> dict:
+        with open(os.path.join(path, _HEADER), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _map(self, path: str, directory: str, count: int, chunks_bytes: int):
+        """Memory-map the first count rows of the generation in directory (of the snapshot at path) as the base segment."""
+        self._base = np.memmap(os.path.join(directory, _VECTORS), dtype=np.float32, mode="r", shape=(count, self.dim))
+        self._base_offsets = np.memmap(os.path.join(directory, _OFFSETS), dtype=np.int64, mode="r", shape=(count + 1,))
+        # np.memmap cannot map an empty file
+        text_path = os.path.join(directory, _TEXTS)
+        self._base_blob = np.memmap(text_path, dtype=np.uint8, mode="r") if self._base_offsets[-1] else np.empty(0, np.uint8)
+        self._n_base = count
+        self._chunks_bytes = chunks_bytes
+        self.path = os.path.abspath(path)
+        self._dir = os.path.abspath(directory)
+
+    @classmethod
+    def open(cls, path: str):
+        """Open the CURRENT generation of a snapshot with memory-mapped vectors and texts; None if absent or incomplete."""
+        for _ in range(3):
+            directory = _current_dir(path)
+            if directory is None:
+                return None
+            try:
+                return cls._open_dir(path, directory)
+            except FileNotFoundError:
+                # pruned by saves in another process after CURRENT was read: read it again
+                continue
+        return None
+
+    @classmethod
+    def _open_dir(cls, path: str, directory: str):
+        if not os.path.exists(os.path.join(directory, _HEADER)):
+            return None
+        header = cls._read_header(directory)
+        count, dim = int(header.get("count") or 0), header.get("dim")
+        if header.get("version") != SNAPSHOT_VERSION or not count or not dim:
+            return None
+        store = cls(dim=int(dim), model=header.get("model") or "")
+        # files may run past the header after an interrupted append; only the committed prefix is used
+        if os.path.getsize(os.path.join(directory, _VECTORS)) < count * store.dim * 4:
+            return None
+        if os.path.getsize(os.path.join(directory, _OFFSETS)) < (count + 1) * 8:
+            return None
+        with open(os.path.join(directory, _CHUNKS), "r", encoding="utf-8") as f:
+            for line in f:
+                if len(store.ids) == count:
+                    break
+                row = json.loads(line)
+                store.ids.append(row["id"])
+                store.metas.append(row.get("metadata") or {})
+        if len(store.ids) != count:
+            return None
+        chunks_bytes = int(header.get("chunks_bytes") or os.path.getsize(os.path.join(directory, _CHUNKS)))
+        store._map(path, directory, count, chunks_bytes)
+        if os.path.getsize(os.path.join(directory, _TEXTS)) < store._base_offsets[-1]:
+            return None
+        return store
+
+
+def top_k_rows(scores: np.ndarray, top_k: int) -> list[tuple[int, float]]:
+    n = len(scores)
+    if n == 0 or top_k <= 0:
+        return []
+    if top_k < n:
+        idx = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        idx = np.arange(n)
+    idx = idx[np.argsort(-scores[idx], kind="stable")]
+    return [(int(i), float(scores[i])) for i in idx]
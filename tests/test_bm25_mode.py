@@ -0,0 +1,35 @@
+import pytest
+from llama_index.core.embeddings import BaseEmbedding
+from src.retrieval import DocStore
+
+
+class UnavailableEmbedding(BaseEmbedding):
+    def _get_text_embedding(self, text):
+        raise RuntimeError("embedder unavailable")
+
+    def _get_text_embeddings(self, texts):
+        raise RuntimeError("embedder unavailable")
+
+    def _get_query_embedding(self, query):
+        raise RuntimeError("embedder unavailable")
+
+    async def _aget_query_embedding(self, query):
+        raise RuntimeError("embedder unavailable")
+
+
+@pytest.mark.parametrize("dedup_distance", [3, -1])
+def test_bm25_mode_indexes_without_embedder(tmp_path, dedup_distance):
+    (tmp_path / "kb").mkdir()
+    (tmp_path / "kb" / "a.txt").write_text("the quarterly invoice for acme corp is overdue", encoding="utf-8")
+    (tmp_path / "kb" / "b.txt").write_text("kubernetes pods restart after the node upgrade", encoding="utf-8")
+    ds = DocStore(embed_model=UnavailableEmbedding(), retrieval_mode="bm25", dedup_distance=dedup_distance,
+                  ingest_workers=1)
+    report = ds.ingest(dirs=[str(tmp_path / "kb")])
+    assert not report.errors and report.embedded == 0
+    assert ds.retrieve("invoice overdue", top_k=1)[0].metadata["source"].endswith("a.txt")
+
+    ds.save_snapshot(str(tmp_path / "snap"))
+    loaded = DocStore(embed_model=UnavailableEmbedding(), retrieval_mode="bm25")
+    assert loaded.load_snapshot(str(tmp_path / "snap"))
+    assert loaded.retrieve("pods restart", top_k=1)[0].metadata["source"].endswith("b.txt")
+    assert not DocStore(embed_model=UnavailableEmbedding()).load_snapshot(str(tmp_path / "snap"))
@@ -0,0 +1,26 @@
+from bench.fakes import FakeChatModel, HashEmbedding
+from contextmgr import load_context_app
+from src.runtime import send_user_message
+
+prompts: list[str] = []
+
+
+class RecordingChatModel(FakeChatModel):
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompts.append("\n".join(str(m.content) for m in messages))
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+
+def test_current_turn_facts_survive_trim(tmp_path):
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    for topic in ("apple", "banana", "cherry", "delta", "echo", "falcon"):
+        (kb / f"{topic}.txt").write_text(f"{topic} " * 60, encoding="utf-8")
+    config = tmp_path / "context.yaml"
+    config.write_text(f"system: s\ndoc_dirs: [{kb}]\nretrieval:\n  mode: bm25\n"
+                      "context_budget:\n  max_tokens: 250\n  truncate: false\n", encoding="utf-8")
+    app, seed, _ = load_context_app(str(config), llm=RecordingChatModel(), embed_model=HashEmbedding())
+    seed("t")
+    send_user_message(app, "t", "apple banana cherry")
+    send_user_message(app, "t", "falcon")
+    assert "falcon falcon" in prompts[-1]
@@ -0,0 +1,34 @@
+from bench.fakes import HashEmbedding
+from src.dedup import resemblance, shingles, simhash
+from src.retrieval import DocStore
+
+TEMPLATE = "[INFO] service=gateway region=eu-west-1 status=ok latency_ms=12 " * 20
+
+
+class CountingEmbedding(HashEmbedding):
+    calls: int = 0
+
+    def _get_text_embeddings(self, texts):
+        self.calls += len(texts)
+        return super()._get_text_embeddings(texts)
+
+
+def test_repeated_boilerplate_does_not_dominate():
+    a = TEMPLATE + "user alice uploaded invoice 1042 for review"
+    b = TEMPLATE.replace("gateway", "billing").replace("12", "97") + "nightly backup of cluster seven finished"
+    assert resemblance(shingles(a), shingles(b)) < 0.8
+    assert simhash(a) != simhash(b)
+
+
+def test_templated_chunks_stay_and_duplicates_skip_embedding(tmp_path):
+    for i in range(20):
+        (tmp_path / f"log{i}.txt").write_text(f"[INFO] job {i} started\n{TEMPLATE}\njob {i} wrote {i * 37} rows to table t{i}\n",
+                                              encoding="utf-8")
+    (tmp_path / "copy.txt").write_text((tmp_path / "log3.txt").read_text(encoding="utf-8"), encoding="utf-8")
+    embed = CountingEmbedding()
+    ds = DocStore(embed_model=embed, chunk_size=4096, chunk_overlap=0, ingest_workers=1)
+    report = ds.ingest(dirs=[str(tmp_path)])
+    assert len(ds._store) == 20
+    assert report.duplicates == 1 and embed.calls == 20
+    row = next(r for r, m in enumerate(ds._store.metas) if m.get("sources") and len(m["sources"]) == 2)
+    assert {s.rsplit("/", 1)[-1] for s in ds._store.metas[row]["sources"]} == {"log3.txt", "copy.txt"}
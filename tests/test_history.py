@@ -0,0 +1,23 @@
+from langchain_core.messages import AIMessage, HumanMessage
+from bench.fakes import FakeChatModel, HashEmbedding
+from contextmgr import load_context_app
+from contextmgr.loader import _history_window
+from src.runtime import get_state, send_user_message
+
+
+def test_window_keeps_oversized_current_turn():
+    messages = [HumanMessage(content="hi"), AIMessage(content="hello"), HumanMessage(content="x " * 5000)]
+    assert _history_window(messages, max_tokens=100) == 2
+    assert _history_window(messages[2:], max_tokens=100) == 0
+    assert _history_window([], max_tokens=100) == 0
+
+
+def test_oversized_turn_through_chat_llm(tmp_path):
+    config = tmp_path / "context.yaml"
+    config.write_text("system: s\nhistory:\n  max_messages: 20\n  max_tokens: 200\n", encoding="utf-8")
+    app, seed, _ = load_context_app(str(config), llm=FakeChatModel(), embed_model=HashEmbedding())
+    seed("t")
+    send_user_message(app, "t", "short question")
+    send_user_message(app, "t", "很长的问题 " * 2000)
+    messages = get_state(app, "t").values["messages"]
+    assert messages[-1].type == "ai" and messages[-2].content.startswith("很长的问题")
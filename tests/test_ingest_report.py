@@ -0,0 +1,10 @@
+from dataclasses import fields
+from src.ingest import IngestReport
+
+
+def test_merge_adds_every_counter():
+    counters = [f.name for f in fields(IngestReport) if f.name != "errors"]
+    first = IngestReport(**{name: 1 for name in counters}, errors={"a.txt": "x"})
+    first.merge(IngestReport(**{name: 2 for name in counters}, errors={"b.txt": "y"}))
+    assert all(getattr(first, name) == 3 for name in counters)
+    assert first.errors == {"a.txt": "x", "b.txt": "y"}
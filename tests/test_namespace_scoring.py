@@ -0,0 +1,27 @@
+import numpy as np
+from src.bm25 import BM25Index
+from src.vecstore import VectorStore
+
+
+def test_bm25_rows_match_full_scores():
+    rng = np.random.default_rng(0)
+    words = "apple banana cherry delta echo foxtrot".split()
+    index = BM25Index()
+    index.add([" ".join(rng.choice(words, 20)) for _ in range(200)])
+    rows = np.sort(rng.choice(200, 37, replace=False))
+    full = index.scores("apple delta", normalize=True)
+    assert np.allclose(index.scores("apple delta", normalize=True, rows=rows), full[rows])
+    assert len(index.scores("apple", rows=np.empty(0, dtype=np.int64))) == 0
+
+
+def test_vector_rows_match_full_scores(tmp_path):
+    rng = np.random.default_rng(1)
+    store = VectorStore(model="m")
+    store.add([str(i) for i in range(300)], ["t"] * 300, [{} for _ in range(300)], rng.standard_normal((300, 8)))
+    store.flush(str(tmp_path))
+    store.add([str(i) for i in range(300, 320)], ["t"] * 20, [{} for _ in range(20)], rng.standard_normal((20, 8)))
+    query, queries = rng.standard_normal(8), rng.standard_normal((3, 8))
+    full, many = store.scores(query), store.scores_many(queries)
+    for rows in (np.array([3, 150, 305]), np.arange(0, 320, 2)):
+        assert np.allclose(store.scores(query, rows), full[rows], atol=1e-6)
+        assert np.allclose(store.scores_many(queries, rows), many[:, rows], atol=1e-6)
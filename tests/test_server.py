@@ -0,0 +1,29 @@
+import asyncio
+import httpx
+from bench.fakes import FakeChatModel, HashEmbedding
+from contextmgr import load_context_app
+from contextmgr.server import ContextServer
+from src.runtime import get_state
+
+
+def test_namespaced_user_does_not_collide_with_slash_user_id(tmp_path):
+    for name in ("shared", "team"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / f"{name}.txt").write_text(f"{name} secret " * 40, encoding="utf-8")
+    config = tmp_path / "context.yaml"
+    config.write_text(f"system: s\ndoc_dirs: [{tmp_path / 'shared'}]\nretrieval:\n  mode: bm25\n"
+                      f"namespaces:\n  team:\n    dirs: [{tmp_path / 'team'}]\n", encoding="utf-8")
+    app, seed, ds = load_context_app(str(config), llm=FakeChatModel(), embed_model=HashEmbedding())
+    server = ContextServer(app, seed, ds)
+
+    async def chat(body):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server), base_url="http://test") as client:
+            return (await client.post("/v1/chat", json=body)).json()["thread_id"]
+
+    tenant = asyncio.run(chat({"user": "alice", "message": "team secret", "namespace": "team"}))
+    outsider = asyncio.run(chat({"user": "team/alice", "message": "team secret"}))
+    assert tenant != outsider
+    state = get_state(app, outsider).values
+    assert not state.get("namespace")
+    assert len(state["messages"]) == 2
+    assert all(ds.get_chunk(cid).metadata.get("namespace") is None for cid in state.get("context_fact_ids") or [])
@@ -0,0 +1,41 @@
+import subprocess
+import sys
+import textwrap
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_hung_tool_does_not_block_exit(tmp_path):
+    config = tmp_path / "context.yaml"
+    config.write_text("system: s\ntool_calls:\n  timeout: 0.3\n", encoding="utf-8")
+    script = textwrap.dedent(f"""
+        import time
+        from langchain_core.messages import AIMessage
+        from langchain_core.outputs import ChatGeneration, ChatResult
+        from bench.fakes import FakeChatModel, HashEmbedding
+        from contextmgr import load_context_app
+        from src.runtime import get_state, send_user_message
+
+        class ToolCaller(FakeChatModel):
+            def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+                if messages[-1].type == "human":
+                    call = {{"name": "hang", "args": {{}}, "id": "c1"}}
+                    return ChatResult(generations=[ChatGeneration(message=AIMessage(content="", tool_calls=[call]))])
+                return super()._generate(messages, stop, run_manager, **kwargs)
+
+        def hang():
+            time.sleep(60)
+
+        app, seed, _ = load_context_app({str(config)!r}, tools=[hang], llm=ToolCaller(), embed_model=HashEmbedding())
+        seed("t")
+        send_user_message(app, "t", "go")
+        print(get_state(app, "t").values["messages"][-2].content)
+        app.close()
+    """)
+    started = time.monotonic()
+    out = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, timeout=30)
+    assert out.returncode == 0, out.stderr
+    assert "timed out" in out.stdout
+    assert time.monotonic() - started < 20